@@ -0,0 +1,211 @@
+import argparse
+import csv
+import glob
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from clean_data import (convert_times, filter_views, find_binge_sessions, finish_views,
+                        read_and_clean, read_export)
+from store_data import PARTITION_COLUMNS, write_cleaned
+
+SHARD_SIZE = 50 * 2**20 # exports bigger than this (in bytes) are split by profile
+# accounts can have profiles of the same name, so the combined store keeps
+# each account's apart
+COMBINED_PARTITIONS = ["Account"] + PARTITION_COLUMNS
+
+def find_exports(source):
+    """
+    Finds the Netflix exports to clean and names the account of each
+
+    Input:
+        source (str): directory to search for ViewingActivity csv files, or
+            a glob of csv files
+
+    Returns (dict): account name for each export filepath
+    """
+    if os.path.isdir(source):
+        root = source
+        paths = glob.glob(os.path.join(source, "**", "ViewingActivity*.csv"),
+                          recursive=True)
+    else:
+        paths = glob.glob(source, recursive=True)
+        root = os.path.commonpath(paths) if len(paths) > 1 else os.path.dirname(source)
+    # name accounts after where their export sits, e.g. smiths/ViewingActivity.csv
+    # is the smiths_ViewingActivity account
+    return {path: os.path.splitext(os.path.relpath(path, root))[0].replace(os.sep, "_")
+            for path in sorted(paths)}
+
+def _profile_of(record, column):
+    # unquoted names in the first column are most of them, and need no parsing
+    if column == 0 and not record.startswith(b'"'):
+        return record.split(b",", 1)[0].decode()
+    return next(csv.reader([record.decode()]))[column]
+
+def plan_shards(filepath, shard_size=SHARD_SIZE):
+    """
+    Splits an export into pieces of work, one per profile for big exports.
+    The export is scanned once for where each profile's lines start, so
+    each piece can be read on its own without parsing the rest
+
+    Input:
+        filepath (filepath): csv filepath
+        shard_size (int): bytes above which an export is split
+
+    Returns (list of tuple): byte offset and length of each piece's lines,
+        None meaning the whole export
+    """
+    if os.path.getsize(filepath) <= shard_size:
+        return [None]
+    with open(filepath, "rb") as f:
+        header = f.readline()
+        column = next(csv.reader([header.decode("utf-8-sig")])).index("Profile Name")
+        profiles, starts = [], []
+        position = start = len(header)
+        record = b""
+        for line in f:
+            record += line
+            position += len(line)
+            if record.count(b'"') % 2:
+                continue # a quoted field carries on to the next line
+            if record.strip():
+                profile = _profile_of(record, column)
+                if not profiles or profile != profiles[-1]:
+                    profiles.append(profile)
+                    starts.append(start)
+            start, record = position, b""
+    # Netflix keeps each profile's views together, if not the export can't
+    # be split without breaking up binges
+    if len(set(profiles)) < len(profiles):
+        return [None]
+    ends = starts[1:] + [position]
+    return [(start, end - start) for start, end in zip(starts, ends)]
+
+def _clean_shard(filepath, shard):
+    start = time.perf_counter()
+    if shard is None:
+        final_df = read_and_clean(filepath, output_path=None)
+    else:
+        # only this profile's lines are read, under the export's header
+        offset, length = shard
+        with open(filepath, "rb") as f:
+            header = f.readline()
+            f.seek(offset)
+            lines = f.read(length)
+        data = read_export(io.BytesIO(header + lines))
+        data_cst = find_binge_sessions(convert_times(filter_views(data)))
+        final_df = finish_views(data_cst)
+    return final_df, time.perf_counter() - start
+
+def combine_shards(shards):
+    """
+    Joins an account's cleaned shards, renumbering sessions to stay unique
+
+    Input:
+        shards (list of pd.dataframe): cleaned data of each shard, in order
+
+    Returns (pd.dataframe): cleaned data of the account
+    """
+    next_session = 0
+    renumbered = []
+    for shard in shards:
+        renumbered.append(shard.assign(**{"Session ID": shard["Session ID"] + next_session}))
+        if len(shard):
+            next_session += shard["Session ID"].max() + 1
+    return pd.concat(renumbered, ignore_index=True)
+
+def batch_clean(source, output_dir, output_format=".parquet", workers=None,
+                shard_size=SHARD_SIZE):
+    """
+    Cleans many Netflix exports in parallel, saving each account's cleaned
+    data along with a combined store of every account, where an Account
+    column tells apart profiles of the same name and session IDs are unique
+    across accounts. An export that fails to clean is reported and skipped
+    without stopping the others
+
+    Input:
+        source (str): directory of ViewingActivity csv files, or a glob
+        output_dir (filepath): directory to save cleaned data in
+        output_format (str): .csv or .parquet
+        workers (int): processes to clean with, defaults to one per core
+        shard_size (int): bytes above which an export is split by profile
+
+    Returns (dict): error message for each export that failed
+    """
+    assert output_format in [".csv", ".parquet"], print("Pick .csv or .parquet")
+    exports = find_exports(source)
+    os.makedirs(output_dir, exist_ok=True)
+    combined_path = os.path.join(output_dir, "combined" + output_format)
+    workers = workers or os.cpu_count()
+
+    errors = {}
+    rows_cleaned = 0
+    combined_written = False
+    # sessions are numbered from 0 in each account, so they are moved up to
+    # stay unique in the combined store
+    next_session = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers) as pool:
+        futures = {}
+        for path in exports:
+            try:
+                shards = plan_shards(path, shard_size)
+            except Exception as error:
+                errors[path] = repr(error)
+                continue
+            for i, shard in enumerate(shards):
+                futures[pool.submit(_clean_shard, path, shard)] = (path, i, len(shards))
+
+        results = {path: {} for path in exports if path not in errors}
+        for done, future in enumerate(as_completed(futures), 1):
+            path, i, num_shards = futures[future]
+            account = exports[path]
+            try:
+                final_df, seconds = future.result()
+            except Exception as error:
+                errors[path] = repr(error)
+                results.pop(path, None)
+                print(f"[{done}/{len(futures)}] {account} failed: {error!r}")
+                continue
+            if path in errors:
+                continue
+            print(f"[{done}/{len(futures)}] {account} shard {i + 1}/{num_shards}: "
+                  f"{len(final_df)} rows in {seconds:.1f}s")
+            results[path][i] = final_df
+
+            if len(results[path]) == num_shards:
+                shards = results.pop(path)
+                account_df = combine_shards([shards[j] for j in range(num_shards)])
+                write_cleaned(account_df, os.path.join(output_dir, account + output_format))
+                combined_df = account_df.assign(**{
+                    "Account": account, "Session ID": account_df["Session ID"] + next_session})
+                write_cleaned(combined_df, combined_path, append=combined_written,
+                              partition_cols=COMBINED_PARTITIONS)
+                combined_written = True
+                if len(account_df):
+                    next_session += account_df["Session ID"].max() + 1
+                rows_cleaned += len(account_df)
+
+    seconds = time.perf_counter() - start
+    print(f"Cleaned {len(exports) - len(errors)} of {len(exports)} exports, "
+          f"{rows_cleaned} rows in {seconds:.1f}s "
+          f"({rows_cleaned / seconds / workers:.0f} rows per second per worker)")
+    return errors
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean many Netflix exports in parallel")
+    parser.add_argument("source", help="directory of ViewingActivity csv files, or a glob")
+    parser.add_argument("output_dir", help="directory to save cleaned data in")
+    parser.add_argument("--format", default=".parquet", choices=[".csv", ".parquet"],
+                        help="format to save cleaned data as")
+    parser.add_argument("--workers", type=int, help="processes to use (default: one per core)")
+    parser.add_argument("--shard-mb", type=float, default=SHARD_SIZE / 2**20,
+                        help="split exports bigger than this by profile")
+    args = parser.parse_args()
+
+    errors = batch_clean(args.source, args.output_dir, args.format, args.workers,
+                         int(args.shard_mb * 2**20))
+    for path, error in errors.items():
+        print(f"{path}: {error}")
+    exit(1 if errors else 0)
@@ -0,0 +1,487 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from clean_data import (filter_views, parse_durations, parse_start_times, read_and_clean,
+                        read_export, split_start_times, stream_and_clean)
+from generate_export import generate_export
+from make_graphs import ANALYSIS_TABLES, BACKENDS, COLUMNS_TIME_DICT, WatchHistory, open_history
+from parse_titles import split_titles
+from rank_data import RankIndex
+from store_data import FORMATS, TEXT_COLUMNS, compact_cleaned, read_cleaned, write_cleaned
+from time_stages import start_recording, stop_recording
+
+SIZES = [10000, 100000, 1000000]
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+SAMPLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ViewingActivity.csv")
+THRESHOLD = 0.25 # slowdown over the baseline counted as a regression
+NOISE_SECONDS = 0.02 # slowdowns smaller than this are ignored
+NOISE_MB = 5 # growth in peak memory smaller than this is ignored
+MIN_SECONDS = 0.5 # quick benchmarks are run until they take this long in all
+MAX_RUNS = 100 # most runs of a quick benchmark
+# cleaners whose peak memory is measured, by name
+CLEANERS = {"read_and_clean": read_and_clean, "stream_and_clean": stream_and_clean}
+# analyses timed, by name, with their options
+BENCHMARKS = {"total by year": ("total", {"time_unit": "year"}),
+              "total by hour": ("total", {"time_unit": "hour of day"}),
+              "average by day of week": ("average", {"time_unit": "day of week"}),
+              "top shows": ("show", {"number_shows": 10}),
+              "top binges": ("binge", {"number_binges": 10}),
+              "top show by month": ("top shows", {"time_unit": "month", "dur_type": "show"}),
+              "top binge by year": ("top shows", {"time_unit": "year", "dur_type": "binge"})}
+# time units the per time frame loop data_by_time_frame replaced is timed on
+LOOP_TIME_UNITS = ["day of month", "hour of day"]
+
+def _best_of(func, repeats):
+    # quick benchmarks get more runs than repeats, as one slow run in a few
+    # is enough to hide their fastest
+    seconds = []
+    while len(seconds) < repeats or (sum(seconds) < MIN_SECONDS and len(seconds) < MAX_RUNS):
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+def benchmark_size(rows, data_dir, repeats=3, seed=0, backends=["pandas"]):
+    """
+    Times cleaning a made up export of a given size and every analysis of it
+
+    Input:
+        rows (int): views in the export
+        data_dir (filepath): directory to keep made up exports in between runs
+        repeats (int): fewest times to run each benchmark, keeping the fastest
+        seed (int): random seed of the export
+        backends (list of str): BACKENDS to time the analyses on; those
+            other than pandas have their name put before each benchmark's
+
+    Returns (dict): seconds taken by each benchmark
+    """
+    export_path = os.path.join(data_dir, f"ViewingActivity_{rows}_{seed}.csv")
+    if not os.path.exists(export_path):
+        generate_export(export_path, rows, seed=seed)
+    cleaned_path = os.path.join(data_dir, f"cleaned_{rows}_{seed}.parquet")
+
+    results = {}
+    # cleaning is broken down by stage, keeping each stage's fastest run
+    runs = []
+    def clean():
+        start_recording()
+        read_and_clean(export_path, output_path=cleaned_path)
+        stages = {}
+        for record in stop_recording():
+            if record["depth"] > 0:
+                name = "read_and_clean/" + record["stage"]
+                stages[name] = stages.get(name, 0) + record["seconds"]
+        runs.append(stages)
+    results["read_and_clean"] = _best_of(clean, repeats)
+    for name in runs[0]:
+        results[name] = min(stages[name] for stages in runs)
+    # cleaning again, with the parsed export cached by the run before
+    read_and_clean(export_path, output_path=cleaned_path, cache=True)
+    results["read_and_clean cached"] = _best_of(
+        lambda: read_and_clean(export_path, output_path=cleaned_path, cache=True), repeats)
+
+    results["load cleaned"] = _best_of(lambda: WatchHistory(cleaned_path), repeats)
+    history = WatchHistory(cleaned_path)
+    results["rank index"] = _best_of(lambda: RankIndex(history.data), repeats)
+
+    _time_analyses(history, "", results, repeats)
+
+    for backend in backends:
+        if backend != "pandas":
+            results[f"{backend}: open cleaned"] = _best_of(
+                lambda: open_history(cleaned_path, backend), repeats)
+            history = open_history(cleaned_path, backend)
+            _time_analyses(history, f"{backend}: ", results, repeats)
+    return results
+
+def measure_formats(rows, data_dir, repeats=3, seed=0):
+    """
+    Saves the cleaned data of a benchmarked export in each of FORMATS, and
+    times loading it whole and loading two columns of its last year
+
+    Input:
+        rows (int): views in the export, already cleaned by benchmark_size
+        data_dir (filepath): directory the export was cleaned in
+        repeats (int): fewest times to save and load each, keeping the fastest
+        seed (int): random seed of the export
+
+    Returns (tuple of dict): seconds of each benchmark, and MB each format
+        takes on disk
+    """
+    data = read_cleaned(os.path.join(data_dir, f"cleaned_{rows}_{seed}.parquet"))
+    last_year = int(data["Start Year"].max())
+    seconds, megabytes = {}, {}
+    for output_format in FORMATS:
+        path = os.path.join(data_dir, f"formats_{rows}_{seed}{output_format}")
+        name = output_format[1:]
+        seconds[f"save {name}"] = _best_of(lambda: write_cleaned(data, path), repeats)
+        seconds[f"load {name}"] = _best_of(lambda: read_cleaned(path), repeats)
+        seconds[f"load {name}, 2 columns of last year"] = _best_of(
+            lambda: read_cleaned(path, ["Title", "Duration (min)"], last_year), repeats)
+        megabytes[f"{name} on disk"] = _disk_megabytes(path)
+    return seconds, megabytes
+
+def measure_in_memory(rows, data_dir, seed=0):
+    """
+    Measures the memory the cleaned data of a benchmarked export takes, as
+    plain strings and wide numbers, as loaded and as compacted
+
+    Input:
+        rows (int): views in the export, already cleaned by benchmark_size
+        data_dir (filepath): directory the export was cleaned in
+        seed (int): random seed of the export
+
+    Returns (dict): MB of each form in memory
+    """
+    data = read_cleaned(os.path.join(data_dir, f"cleaned_{rows}_{seed}.parquet"))
+    # how the cleaner used to keep it, before text was categories or codes
+    # and start time parts small integers
+    wide = data.astype({**{col: object for col in TEXT_COLUMNS if col in data},
+                        **{col: "int64" for col in data.select_dtypes("integer")}})
+    forms = {"plain": wide, "expanded": data, "compact": compact_cleaned(data)}
+    return {f"in memory, {form}": float(frame.memory_usage(deep=True).sum()) / 2**20
+            for form, frame in forms.items()}
+
+def measure_rewrites(rows, data_dir, repeats=3, seed=0):
+    """
+    Times the code that earlier rewrites replaced against what replaced it,
+    on the same data, so that their speedups can be checked
+
+    Input:
+        rows (int): views in the export, already cleaned by benchmark_size
+        data_dir (filepath): directory the export was cleaned in
+        repeats (int): fewest times to run each, keeping the fastest
+        seed (int): random seed of the export
+
+    Returns (dict): seconds of each benchmark
+    """
+    cleaned_path = os.path.join(data_dir, f"cleaned_{rows}_{seed}.parquet")
+    seconds = {}
+    # top show per time frame, as the old loop read the cleaned csv
+    data = read_cleaned(cleaned_path)
+    history = WatchHistory(cleaned_path)
+    for time_unit in LOOP_TIME_UNITS:
+        seconds[f"top show by {time_unit}, per frame loop"] = _best_of(
+            lambda: _top_by_time_frame_loop(data, COLUMNS_TIME_DICT[time_unit]), repeats)
+        def grouped():
+            history.clear_views()
+            history.data_by_time_frame(time_unit, dur_type="show")
+        seconds[f"top show by {time_unit}, grouped"] = _best_of(grouped, repeats)
+    return seconds
+
+def measure_parsing(export_path, repeats=3):
+    """
+    Times parsing start times and durations, splitting up start times and
+    splitting up titles, the old way and the way read_and_clean does it now
+
+    Input:
+        export_path (filepath): Netflix export csv
+        repeats (int): fewest times to parse it each way, keeping the fastest
+
+    Returns (dict): seconds of each way
+    """
+    data = filter_views(read_export(export_path))
+    def parse():
+        parsed = data.assign(**{"Start Time": parse_start_times(data["Start Time"]),
+                                "Duration": parse_durations(data["Duration"])})
+        split_start_times(parsed)
+    return {"parse times, old": _best_of(lambda: _parse_times_old(data), repeats),
+            "parse times": _best_of(parse, repeats),
+            "split titles, old": _best_of(lambda: _split_titles_old(data["Title"]), repeats),
+            "split titles": _best_of(lambda: split_titles(data["Title"]), repeats)}
+
+def _parse_times_old(data):
+    # how read_and_clean used to parse and split up times, inferring the
+    # format of every start time and converting them through the index
+    data = data.assign(**{"Start Time": pd.to_datetime(data["Start Time"], utc=True)})
+    data_utc = data.set_index("Start Time")
+    data_utc.index = data_utc.index.tz_convert("US/Central")
+    data_cst = data_utc.reset_index()
+    data_cst["Duration"] = pd.to_timedelta(data_cst["Duration"])
+    data_cst["Start Year"] = data_cst["Start Time"].dt.year
+    data_cst["Start Month"] = data_cst["Start Time"].dt.month
+    data_cst["Start Day"] = data_cst["Start Time"].dt.day
+    data_cst["Start Day of Week"] = data_cst["Start Time"].dt.weekday
+    data_cst["Start Hour"] = data_cst["Start Time"].dt.hour
+    data_cst["Start Minute"] = data_cst["Start Time"].dt.minute
+    return data_cst
+
+def _split_titles_old(titles):
+    # how read_and_clean used to split up titles, a row at a time with its
+    # special cases written out
+    title_info = titles.str.split(":").apply(lambda row: [col.strip() for col in row])
+    title, subtitle, season, episode = [], [], [], []
+
+    for row in title_info:
+        title.append(row[0])
+        if len(row) == 2:
+            subtitle.append(row[1])
+            season.append("")
+            episode.append("")
+            continue
+        if "Part " in row[-1] and len(row) > 3: # for episodes such as Manchester: Part I
+                row = row[:]
+                new_item = row.pop(-2) + ": " + row.pop(-1)
+                row.append(new_item)
+        if len(row) > 2:
+            # special cases
+            if "Book" in row[1]:
+                subtitle.append("")
+                if "Avatar" in row[0]:
+                    season.append(row[1])
+                    episode.append(row[2])
+                else:
+                    season.append(": ".join(row[1:3]))
+                    episode.append(row[3])
+                continue
+            if "Bleach" in row[0]:
+                subtitle.append("")
+                season.append(row[1])
+                episode.append(row[2])
+                continue
+            if "Comedians in Cars Getting Coffee" == row[0]:
+                subtitle.append("")
+                if row[1] == "New 2018": # special season
+                    row[1] = row[1] + ": " + row.pop(2)
+                season.append(row[1])
+                episode.append(": ".join(row[2:]))
+                continue
+            if row[1] == "Black & White":
+                subtitle.append(row[1])
+                season.append(row[2])
+                episode.append(row[4])
+                continue
+            # general rules
+            if "Season" in row[1] or "Part" in row[1] or "Volume" in row[1]:
+                subtitle.append("")
+                season.append(row[1])
+                episode.append(row[2])
+                continue
+            elif len(row) == 3:
+                subtitle.append(row[1])
+                season.append("")
+                episode.append(row[2])
+                continue
+            elif len(row) == 4:
+                subtitle.append(row[1])
+                season.append(row[2])
+                episode.append(row[3])
+                continue
+        # movie or some other thing of 1 item length
+        subtitle.append("")
+        season.append("")
+        episode.append("")
+    return title, subtitle, season, episode
+
+def _top_by_time_frame_loop(data, time_col, duration_col="Duration (min)"):
+    # how data_by_time_frame used to find the top show of each time frame,
+    # with concat standing in for the DataFrame.append pandas 2 removed
+    data_to_use = data[[time_col, duration_col, "Title"]]
+    barplot = None
+    for time_value in data_to_use[time_col].unique()[::-1]:
+        df = data_to_use[ (data_to_use[time_col] == time_value) ]
+        df = df.groupby(["Title", time_col], observed=True).sum().reset_index()
+        max_row = df[ (df[duration_col] == max(df[duration_col])) ]
+        barplot = max_row if barplot is None else pd.concat([barplot, max_row], ignore_index=True)
+    return barplot.sort_values(by=time_col)
+
+def _disk_megabytes(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path) / 2**20
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names) / 2**20
+
+def _time_analyses(history, prefix, results, repeats):
+    for name, (analysis, options) in BENCHMARKS.items():
+        def run():
+            history.clear_views()
+            getattr(history, ANALYSIS_TABLES[analysis])(**options)
+        results[prefix + name] = _best_of(run, repeats)
+
+def _peak_memory(cleaner, export_path, output_path):
+    # run in a process of its own, so the peak is of this clean alone
+    if cleaner:
+        CLEANERS[cleaner](export_path, output_path=output_path)
+    if os.path.exists("/proc/self/status"):
+        # Linux counts ru_maxrss from the memory of the process that started
+        # this one, so its peak for this process alone is read instead
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("VmHWM")) / 2**10
+    import resource
+    # in bytes on macOS, kilobytes elsewhere
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / \
+        (2**20 if sys.platform == "darwin" else 2**10)
+
+def measure_memory(rows, data_dir, seed=0):
+    """
+    Measures the peak memory of cleaning a made up export of a given size
+    with each of CLEANERS, each in a new process. Unix only
+
+    Input:
+        rows (int): views in the export
+        data_dir (filepath): directory to keep made up exports in between runs
+        seed (int): random seed of the export
+
+    Returns (dict): peak MB of each cleaner, and of a process that only
+        imports them, which the cleaners start from
+    """
+    export_path = os.path.join(data_dir, f"ViewingActivity_{rows}_{seed}.csv")
+    if not os.path.exists(export_path):
+        generate_export(export_path, rows, seed=seed)
+    output_path = os.path.join(data_dir, f"memory_{rows}_{seed}.csv")
+
+    results = {}
+    # spawned rather than forked, so nothing of this process is counted
+    context = multiprocessing.get_context("spawn")
+    for name in [None] + list(CLEANERS):
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            peak = pool.submit(_peak_memory, name, export_path, output_path).result()
+        results[f"peak MB {name or 'imports only'}"] = peak
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    return results
+
+def find_regressions(results, baseline, threshold=THRESHOLD, noise=NOISE_SECONDS, unit="s"):
+    """
+    Compares benchmark results with a baseline
+
+    Input:
+        results (dict): seconds (or MB) of each benchmark by size, as from
+            run_benchmarks
+        baseline (dict): earlier results to compare with
+        threshold (float): slowdown counted as a regression, e.g. 0.25 for 25%
+        noise (float): slowdowns smaller than this are ignored
+        unit (str): unit of the results, to report them in
+
+    Returns (list of str): description of each regression
+    """
+    regressions = []
+    for size, timings in results.items():
+        for name, seconds in timings.items():
+            before = baseline.get(size, {}).get(name)
+            if before is not None and seconds > before * (1 + threshold) and \
+                    seconds - before > noise:
+                regressions.append(f"{name} at {size} rows: {before:.3f}{unit} -> "
+                                   f"{seconds:.3f}{unit} (+{seconds / before - 1:.0%})")
+    return regressions
+
+def scaling(results):
+    """
+    Works out how each benchmark grows with rows between the two largest
+    sizes, as the power of rows it takes time in (1 linear, 2 quadratic)
+
+    Input:
+        results (dict): seconds of each benchmark by size
+
+    Returns (dict): growth of each benchmark
+    """
+    sizes = sorted(results, key=int)
+    if len(sizes) < 2:
+        return {}
+    small, large = sizes[-2], sizes[-1]
+    return {name: math.log(max(seconds, 1e-6) / max(results[small].get(name, 0), 1e-6)) /
+            math.log(int(large) / int(small))
+            for name, seconds in results[large].items() if name in results[small]}
+
+def run_benchmarks(sizes=SIZES, data_dir=None, repeats=3, seed=0, backends=["pandas"],
+                   memory=False):
+    """
+    Times cleaning and every analysis at each size
+
+    Input:
+        sizes (list of int): views in each made up export
+        data_dir (filepath): directory to keep made up exports in, defaults
+            to one in the temp directory
+        repeats (int): fewest times to run each analysis, keeping the fastest
+        seed (int): random seed of the exports
+        backends (list of str): BACKENDS to time the analyses on
+        memory (bool): also measure the peak memory of cleaning
+
+    Returns (tuple of dict): seconds of each benchmark by size, and MB of
+        each format on disk, of each form in memory and, if memory, peak MB
+        of each cleaner, by size
+    """
+    data_dir = data_dir or os.path.join(tempfile.gettempdir(), "netflix_benchmarks")
+    os.makedirs(data_dir, exist_ok=True)
+    results, megabytes = {}, {}
+    for rows in sizes:
+        start = time.perf_counter()
+        results[str(rows)] = benchmark_size(rows, data_dir, repeats, seed, backends)
+        seconds, megabytes[str(rows)] = measure_formats(rows, data_dir, repeats, seed)
+        results[str(rows)].update(seconds)
+        results[str(rows)].update(measure_rewrites(rows, data_dir, repeats, seed))
+        megabytes[str(rows)].update(measure_in_memory(rows, data_dir, seed))
+        results[str(rows)].update(measure_parsing(
+            os.path.join(data_dir, f"ViewingActivity_{rows}_{seed}.csv"), repeats))
+        if memory:
+            megabytes[str(rows)].update(measure_memory(rows, data_dir, seed))
+        print(f"{rows} rows benchmarked in {time.perf_counter() - start:.1f}s")
+    return results, megabytes
+
+def _print_table(results, unit="s"):
+    growth = scaling(results)
+    sizes = list(results)
+    print(f"{'benchmark':42}" + "".join(f"{size:>11}" for size in sizes) + "   growth")
+    for name in results[sizes[-1]]:
+        print(f"{name:42}" + "".join(f"{results[size].get(name, 0):10.3f}{unit}"
+                                     for size in sizes) +
+              (f"   n^{growth[name]:.2f}" if name in growth else ""))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time cleaning and analysing made up exports "
+                                     "of growing size, and compare with a baseline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="views per export")
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="runs of each benchmark, more for quick ones")
+    parser.add_argument("--data-dir", help="directory to keep made up exports in")
+    parser.add_argument("--backends", nargs="+", default=["pandas"], choices=BACKENDS,
+                        help="backends to time the analyses on, to compare them")
+    parser.add_argument("--memory", action="store_true",
+                        help="also measure the peak memory of each cleaner, in a new process "
+                        "each (Unix only)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline results to compare with")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="save these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="slowdown over the baseline counted as a regression")
+    parser.add_argument("--output", help="also save the results to this json file")
+    args = parser.parse_args()
+
+    results, megabytes = run_benchmarks(args.sizes, args.data_dir, args.repeats,
+                                        backends=args.backends, memory=args.memory)
+    _print_table(results)
+    _print_table(megabytes, "M")
+    # parsing is also timed on the real sample export, as made up ones may
+    # not have its quirks
+    sample = measure_parsing(SAMPLE_PATH, args.repeats) if os.path.exists(SAMPLE_PATH) else {}
+    if sample:
+        print(f"{os.path.basename(SAMPLE_PATH)}: " +
+              ", ".join(f"{name} {seconds:.3f}s" for name, seconds in sample.items()))
+
+    saved = {"machine": platform.platform(), "results": results, "megabytes": megabytes,
+             "sample": sample}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(saved, f, indent=1)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(saved, f, indent=1)
+        print(f"Saved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline["results"], args.threshold) + \
+            find_regressions(megabytes, baseline.get("megabytes", {}), args.threshold,
+                             NOISE_MB, "M")
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        print(f"{len(regressions)} regressions against {args.baseline}")
+        exit(1 if regressions else 0)
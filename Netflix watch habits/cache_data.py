@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import pyarrow as pa
+import pyarrow.feather as feather
+from time_stages import stage
+
+CACHE_SUFFIX = ".cache.feather" # cache of an export is saved next to it, named after it
+KEY_FIELD = b"export key"
+
+def cache_path(filepath):
+    """
+    Names the cache of an export
+
+    Input:
+        filepath (filepath): csv filepath
+
+    Returns (filepath): where its cache is saved
+    """
+    return filepath + CACHE_SUFFIX
+
+def file_digest(filepath):
+    """
+    Hashes the contents of a file
+
+    Input:
+        filepath (filepath): file to hash
+
+    Returns (str): sha256 of the file
+    """
+    with open(filepath, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+def export_key(filepath, digest=None):
+    """
+    Identifies the version of an export by its size, modification time and
+    contents
+
+    Input:
+        filepath (filepath): csv filepath
+        digest (str): hash of the file if already known, else it is hashed
+
+    Returns (dict): size, mtime and sha256 of the file
+    """
+    stats = os.stat(filepath)
+    return {"size": stats.st_size, "mtime": stats.st_mtime_ns,
+            "sha256": digest or file_digest(filepath)}
+
+def _cache_matches(filepath, key):
+    stats = os.stat(filepath)
+    if stats.st_size != key["size"]:
+        return False
+    # the same size and modification time is taken as the same file; a
+    # touched or copied file is only reused if its contents are the same
+    return stats.st_mtime_ns == key["mtime"] or file_digest(filepath) == key["sha256"]
+
+@stage
+def read_cache(filepath, columns=None):
+    """
+    Loads the parsed views of an export from its cache, if the export hasn't
+    changed since the cache was saved. The cache is memory mapped, so only
+    the columns asked for are read from disk
+
+    Input:
+        filepath (filepath): csv filepath
+        columns (list of str): columns to read, defaults to all of them
+
+    Returns (pd.dataframe): parsed views, or None if there is no cache or
+        it is out of date
+    """
+    path = cache_path(filepath)
+    if not os.path.exists(path):
+        return None
+    try:
+        with pa.memory_map(path) as source:
+            schema = pa.ipc.open_file(source).schema
+        key = json.loads(schema.metadata[KEY_FIELD])
+    except (pa.ArrowInvalid, KeyError, TypeError, ValueError):
+        return None # not a cache saved by write_cache
+    if not _cache_matches(filepath, key) or \
+            any(col not in schema.names for col in columns or []):
+        return None
+    if columns is not None:
+        # in the export's order, as pd.read_csv gives them
+        columns = [col for col in schema.names if col in columns]
+    return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+@stage
+def write_cache(data, filepath, key):
+    """
+    Saves the parsed views of an export next to it, keyed by the export's
+    size, modification time and hash so read_cache can tell when it changes.
+    The cache is uncompressed so that it can be memory mapped. If it can't be
+    saved, e.g. next to an export in a read only directory, a warning is
+    printed and the views are used uncached
+
+    Input:
+        data (pd.dataframe): parsed views of the export
+        filepath (filepath): csv filepath
+        key (dict): export_key of the export, taken before it was read so
+            that a change while parsing it isn't missed
+    """
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    metadata = {**table.schema.metadata, KEY_FIELD: json.dumps(key).encode()}
+    path = cache_path(filepath)
+    # written under another name first, so a run reading the cache never
+    # sees half of it
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        feather.write_feather(table.replace_schema_metadata(metadata), temp_path,
+                              compression="uncompressed")
+        os.replace(temp_path, path)
+    except OSError as error:
+        print(f"Couldn't cache {filepath}, it will be parsed again next time: {error}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
@@ -1,18 +1,109 @@
-from datetime import timedelta
+import time
+_import_start = time.perf_counter()
+import argparse
+from datetime import datetime, timedelta
+import json
+import os
+import numpy as np
 import pandas as pd
+from cache_data import export_key, read_cache, write_cache
+from parse_titles import load_title_rules, split_titles
+from rollup_data import build_rollup, update_rollup
+from store_data import TIMEZONE, compact_cleaned, get_format, read_cleaned, write_cleaned
+from time_stages import (TRACE_FORMATS, stage, start_recording, stop_recording,
+                         summarize, write_trace)
+_import_seconds = time.perf_counter() - _import_start
 
-def read_and_clean(filepath, profiles=None):
+OUTPUT_PATH = "output.csv"
+RAW_COLUMNS = ["Profile Name", "Start Time", "Duration", "Title",
+               "Supplemental Video Type", "Device Type"]
+# full Netflix exports, then exports re-saved by Excel
+START_TIME_FORMATS = ["%Y-%m-%d %H:%M:%S", "%m/%d/%Y %H:%M"]
+BINGE_GAP = timedelta(minutes=1)
+CHUNKSIZE = 100000
+
+@stage
+def read_export(filepath, columns=RAW_COLUMNS, cache=False, **kwargs):
     """
-    Reads in and cleans a csv file to analyze for Netflix watch patterns
+    Reads the columns needed for cleaning from a Netflix export
 
     Input:
         filepath (filepath): csv filepath
-        profile (list of str): profile name(s) to filter
-    
-    Returns (pd.dataframe): cleaned dataframe
+        columns (list of str): columns to read, some of RAW_COLUMNS
+        cache (bool): reuse the views parsed by an earlier run, saved next
+            to the export (see cache_data.py), or parse and save them if the
+            export is new or has changed. Start times and durations come
+            back already parsed
+        kwargs: other pd.read_csv options, e.g. nrows, which skip the cache
+
+    Returns (pd.dataframe): raw views
+    """
+    if not cache or kwargs:
+        return pd.read_csv(filepath, usecols=columns, **kwargs)
+    data = read_cache(filepath, columns)
+    if data is None:
+        key = export_key(filepath)
+        data = pd.read_csv(filepath, usecols=RAW_COLUMNS)
+        data = data.assign(**{"Start Time": parse_start_times(data["Start Time"]),
+                              "Duration": parse_durations(data["Duration"])})
+        write_cache(data, filepath, key)
+        data = data[[col for col in data.columns if col in columns]]
+    return data
+
+@stage
+def find_binge_sessions(data, gap=BINGE_GAP):
+    """
+    Groups each profile's views into binge sessions, where a view starting
+    no more than gap after the prior view ended continues the session
+
+    Input:
+        data (pd.dataframe): views with Profile Name, Start Time, Duration
+            and Duration (min) columns
+        gap (timedelta): longest break allowed within a session
+
+    Returns (pd.dataframe): data with Binge (min), Session ID, Session Start,
+        Session End and Session Episodes columns added. Binge (min) holds the
+        session total on the session's latest view and 0 elsewhere
+    """
+    # sort oldest to newest per profile, keeping later rows of the export
+    # (which are older) first on tied start times, comparing times as
+    # datetime64 as timezone aware ones would be compared as objects
+    order = np.lexsort((-np.arange(len(data)),
+                        data["Start Time"].to_numpy(dtype="datetime64[ns]"),
+                        pd.factorize(data["Profile Name"])[0]))
+    views = data.iloc[order]
+
+    start = views["Start Time"]
+    end = start + views["Duration"]
+    prior_end = end.groupby(views["Profile Name"], sort=False).shift()
+    new_session = prior_end.isna() | (start - prior_end > gap)
+    session_id = new_session.cumsum() - 1
+
+    sessions = views["Duration (min)"].groupby(session_id)
+    last_view = session_id.ne(session_id.shift(-1))
+    binge = round(sessions.cumsum(), 2).where(last_view, 0)
+
+    views = views.assign(**{
+        "Binge (min)": binge,
+        "Session ID": session_id,
+        "Session Start": start.groupby(session_id).transform("min"),
+        "Session End": end.groupby(session_id).transform("max"),
+        "Session Episodes": sessions.transform("size"),
+    })
+    return views.sort_index()
+
+@stage
+def filter_views(data, profiles=None):
     """
-    data = pd.read_csv(filepath)
+    Drops views that aren't needed for analysis
+
+    Input:
+        data (pd.dataframe): raw Netflix viewing activity
+        profile (list of str): profile name(s) to filter
 
+    Returns (pd.dataframe): views of the chosen profiles, without
+        supplemental videos
+    """
     # filter user(s) if given an input
     if profiles:
         try:
@@ -26,162 +117,416 @@ def read_and_clean(filepath, profiles=None):
 
     data = data[ (data["Supplemental Video Type"].isnull()) ]
 
-    data_reduced = data.drop(['Attributes', 'Supplemental Video Type', 'Bookmark',
-                            'Latest Bookmark','Country'], axis = 1)
-    data_reduced["Start Time"] =  pd.to_datetime(data_reduced["Start Time"],
-                                                utc=True)
+    return data.drop(['Supplemental Video Type'], axis = 1)
+
+def parse_start_times(start_times):
+    """
+    Parses start times from a Netflix export and converts them to TIMEZONE
+
+    Input:
+        start_times (pd.series): start time strings, in UTC, or times
+            already parsed
+
+    Returns (pd.series): timezone aware start times
+    """
+    if isinstance(start_times.dtype, pd.DatetimeTZDtype):
+        return start_times.dt.tz_convert(TIMEZONE)
+    # work out the format once from the first time rather than per string
+    time_format = None
+    if start_times.notna().any():
+        first = start_times[start_times.notna()].iloc[0]
+        for candidate in START_TIME_FORMATS:
+            try:
+                datetime.strptime(first, candidate)
+            except ValueError:
+                continue
+            time_format = candidate
+            break
+    start_times = pd.to_datetime(start_times, format=time_format, utc=True, cache=True)
+    return start_times.dt.tz_convert(TIMEZONE)
+
+def parse_durations(durations):
+    """
+    Parses view durations, converting each distinct duration string once
+
+    Input:
+        durations (pd.series): durations such as 0:42:13, or durations
+            already parsed
+
+    Returns (pd.series): durations as time deltas
+    """
+    if pd.api.types.is_timedelta64_dtype(durations):
+        return durations
+    codes, uniques = pd.factorize(durations)
+    parsed = pd.to_timedelta(uniques).take(codes, allow_fill=True, fill_value=pd.NaT)
+    return pd.Series(parsed, index=durations.index)
+
+@stage
+def split_start_times(data, timezones=None):
+    """
+    Splits start times into year, month, day, day of week, hour and minute
+    in one pass, using each profile's own timezone
+
+    Input:
+        data (pd.dataframe): views with Profile Name and Start Time columns
+        timezones (dict): timezone of each profile not in TIMEZONE
+
+    Returns (dict): Start Year, Start Month, Start Day, Start Day of Week,
+        Start Hour and Start Minute arrays
+    """
+    local_times = data["Start Time"].dt.tz_localize(None)
+    for timezone in set((timezones or {}).values()):
+        in_timezone = data["Profile Name"].isin(
+            [profile for profile, tz in timezones.items() if tz == timezone])
+        local_times[in_timezone] = data.loc[in_timezone, "Start Time"] \
+            .dt.tz_convert(timezone).dt.tz_localize(None)
+
+    minutes = local_times.to_numpy().astype("datetime64[m]").astype(np.int64)
+    days = (minutes // 1440).astype("datetime64[D]")
+    months = days.astype("datetime64[M]")
+    return {"Start Year": (days.astype("datetime64[Y]").astype(np.int64) + 1970).astype(np.int16),
+            "Start Month": (months.astype(np.int64) % 12 + 1).astype(np.int8),
+            "Start Day": ((days - months).astype(np.int64) + 1).astype(np.int8),
+            # 1 Jan 1970 was a Thursday
+            "Start Day of Week": ((days.astype(np.int64) + 3) % 7).astype(np.int8),
+            "Start Hour": (minutes % 1440 // 60).astype(np.int8),
+            "Start Minute": (minutes % 60).astype(np.int8)}
 
-    # change the Start Time column into the dataframe's index
-    data_utc = data_reduced.set_index('Start Time')
-    # convert from UTC timezone to central time
-    data_utc.index = data_utc.index.tz_convert('US/Central')
-    # reset the index so that Start Time becomes a column again
-    data_cst = data_utc.reset_index()
+@stage
+def convert_times(data_reduced):
+    """
+    Converts start times to central time and durations to minutes
 
-    # convert the duration column to a time delta
-    data_cst["Duration"] = pd.to_timedelta(data_cst["Duration"])
+    Input:
+        data_reduced (pd.dataframe): output of filter_views
+
+    Returns (pd.dataframe): data with Start Time and Duration parsed and
+        Duration (min) added
+    """
+    data_cst = data_reduced.assign(**{
+        "Start Time": parse_start_times(data_reduced["Start Time"]),
+        "Duration": parse_durations(data_reduced["Duration"])})
 
     # Convert duration into minutes
     data_cst["Duration (min)"] = round(data_cst["Duration"].dt.seconds / 60, 2)
 
-    # find consecutive watch time
-    consec_data_cst = data_cst[["Start Time", "Duration (min)", "Duration"]]
-
-    consec_watch_time = []
-    num_entries = consec_data_cst.shape[0]
-
-    for i in range(num_entries-1,-1,-1):
-        row = consec_data_cst.iloc[i]
-        current_duration = row["Duration (min)"]
-        if i == num_entries-1:
-            consec_watch_time.append(current_duration)
-        else:
-            current_start = row["Start Time"]
-            prior_watch = consec_data_cst.iloc[i+1]
-            prior_start = prior_watch["Start Time"]
-            prior_duration = prior_watch["Duration"]
-            prior_end = prior_start + prior_duration
-            if current_start - prior_end <= timedelta(minutes=1):
-                time_watching = consec_watch_time[0] + current_duration
-                consec_watch_time[0] = 0
-                consec_watch_time.insert(0, time_watching)
-            else:
-                consec_watch_time.insert(0, current_duration)
-    data_cst = data_cst.assign(Binge = consec_watch_time)
-    data_cst.rename(columns={"Binge": "Binge (min)"}, inplace=True)
+    return data_cst.reset_index(drop=True)
+
+@stage
+def finish_views(data_cst, title_rules=None, title_cache=None, timezones=None):
+    """
+    Drops very short views and splits up start times and titles
 
+    Input:
+        data_cst (pd.dataframe): output of find_binge_sessions
+        title_rules (list of dict): rules for splitting titles, see
+            parse_titles.TITLE_RULES
+        title_cache (filepath): json file to keep parsed titles in between runs
+        timezones (dict): timezone of each profile not in TIMEZONE, used to
+            split up start times
+
+    Returns (pd.dataframe): cleaned dataframe
+    """
     # want only if duration is longer than 30 seconds as don't want to include
     # trailers etc (which Netflix counts as views)
     data_cst = data_cst[ (data_cst["Duration"] > '0 days 00:00:30') ]
 
     # Split up watch start time to make easier to sum
-    data_cst["Start Year"] = data_cst["Start Time"].dt.year
-    data_cst["Start Month"] = data_cst["Start Time"].dt.month
-    data_cst["Start Day"] = data_cst["Start Time"].dt.day
-    data_cst["Start Day of Week"] = data_cst["Start Time"].dt.weekday
-    data_cst["Start Hour"] = data_cst["Start Time"].dt.hour
-    data_cst["Start Minute"] = data_cst["Start Time"].dt.minute
+    data_cst = data_cst.assign(**split_start_times(data_cst, timezones))
 
     # reorder column order
     data_cst = data_cst.drop(["Start Time", "Duration"], axis = 1)
     data_cst = data_cst[['Profile Name', 'Start Year', 'Start Month',
                          'Start Day', 'Start Day of Week', 'Start Hour',
                          'Start Minute', 'Duration (min)', 'Binge (min)',
-                         'Title', 'Device Type']]
+                         'Session ID', 'Session Start', 'Session End',
+                         'Session Episodes', 'Title', 'Device Type']]
 
     # get show info more organized by splitting title column
-    title_info = data_cst["Title"].str.split(":").apply(lambda row: [col.strip() for col in row])
-    title, subtitle, season, episode = [], [], [], []
-
-    for row in title_info:
-        title.append(row[0])
-        if len(row) == 2:
-            subtitle.append(row[1])
-            season.append("")
-            episode.append("")
-            continue
-        if "Part " in row[-1] and len(row) > 3: # for episodes such as Manchester: Part I
-                row = row[:]
-                new_item = row.pop(-2) + ": " + row.pop(-1)
-                row.append(new_item)
-        if len(row) > 2:    
-            # special cases
-            if "Book" in row[1]:
-                subtitle.append("")
-                if "Avatar" in row[0]:
-                    season.append(row[1])
-                    episode.append(row[2])
-                else:
-                    season.append(": ".join(row[1:3]))
-                    episode.append(row[3])
-                continue
-            if "Bleach" in row[0]:
-                subtitle.append("")
-                season.append(row[1])
-                episode.append(row[2])
-                continue
-            if "Comedians in Cars Getting Coffee" == row[0]:
-                subtitle.append("")
-                if row[1] == "New 2018": # special season
-                    row[1] = row[1] + ": " + row.pop(2)
-                season.append(row[1])
-                episode.append(": ".join(row[2:]))
-                continue
-            if row[1] == "Black & White":
-                subtitle.append(row[1])
-                season.append(row[2])
-                episode.append(row[4])
-                continue
-            # general rules
-            if "Season" in row[1] or "Part" in row[1] or "Volume" in row[1]:
-                subtitle.append("")
-                season.append(row[1])
-                episode.append(row[2])
-                continue
-            elif len(row) == 3:
-                subtitle.append(row[1])
-                season.append("")
-                episode.append(row[2])
-                continue
-            elif len(row) == 4:
-                subtitle.append(row[1])
-                season.append(row[2])
-                episode.append(row[3])
-                continue
-        # movie or some other thing of 1 item length
-        subtitle.append("")
-        season.append("")
-        episode.append("")
-
+    title_info = split_titles(data_cst["Title"], title_rules, title_cache)
     base_df = data_cst.drop(["Title"], axis = 1)
-    final_df = base_df.assign(Title = title,
-                              Subtitle = subtitle,
-                              Season = season,
-                              Episode = episode)
+    return pd.concat([base_df, title_info], axis = 1)
+
+@stage
+def read_and_clean(filepath, profiles=None, title_rules=None, title_cache=None,
+                   output_path=OUTPUT_PATH, rollup_path=None, timezones=None,
+                   compact=False, cache=False):
+    """
+    Reads in and cleans a csv file to analyze for Netflix watch patterns
+
+    Input:
+        filepath (filepath): csv filepath
+        profile (list of str): profile name(s) to filter
+        title_rules (list of dict): rules for splitting titles, see
+            parse_titles.TITLE_RULES
+        title_cache (filepath): json file to keep parsed titles in between runs
+        output_path (filepath): where to save the cleaned data, as .csv,
+            .parquet or .feather, or None to not save it
+        rollup_path (filepath): where to also save a rollup of the cleaned
+            data (see rollup_data.py), if wanted
+        timezones (dict): timezone of each profile not in TIMEZONE, used for
+            its start year, month, day, hour and minute
+        compact (bool): return the cleaned data packed by
+            store_data.compact_cleaned, which takes far less memory
+        cache (bool): keep the parsed export in a cache next to it, so
+            that cleaning it again skips parsing it (see cache_data.py)
     
-    final_df.to_csv(r"C:\Users\matth\OneDrive\Documents\Coding Projects\Netflix watch habits\output.csv", index=False)
+    Returns (pd.dataframe): cleaned dataframe
+    """
+    data = read_export(filepath, cache=cache)
+    data_cst = convert_times(filter_views(data, profiles))
+
+    # find consecutive watch time
+    data_cst = find_binge_sessions(data_cst)
+
+    final_df = finish_views(data_cst, title_rules, title_cache, timezones)
+    if output_path:
+        write_cleaned(final_df, output_path)
+    if rollup_path:
+        write_cleaned(build_rollup(final_df), rollup_path)
+    return compact_cleaned(final_df) if compact else final_df
+
+@stage
+def stream_and_clean(filepath, profiles=None, title_rules=None, title_cache=None,
+                     output_path=OUTPUT_PATH, chunksize=CHUNKSIZE, rollup_path=None,
+                     timezones=None):
+    """
+    Cleans a csv file like read_and_clean, but reads and writes it in chunks
+    so that memory use doesn't grow with the size of the file. Expects views
+    grouped by profile and newest first, as Netflix exports them, and stops
+    with a ValueError at a profile found again after its views ended, as
+    sessions can't be found in one pass then
+
+    Input:
+        filepath (filepath): csv filepath
+        profile (list of str): profile name(s) to filter
+        title_rules (list of dict): rules for splitting titles, see
+            parse_titles.TITLE_RULES
+        title_cache (filepath): json file to keep parsed titles in between runs
+        output_path (filepath): where to save the cleaned data, as .csv or
+            .parquet
+        chunksize (int): rows to read at a time
+        rollup_path (filepath): where to also save a rollup of the cleaned
+            data (see rollup_data.py), if wanted
+        timezones (dict): timezone of each profile not in TIMEZONE, used for
+            its start year, month, day, hour and minute
+
+    Returns (int): number of cleaned rows written
+    """
+    if get_format(output_path) == ".feather":
+        raise ValueError("Feather files can't be appended to, stream to .csv or .parquet")
+    carried = None
+    next_session = 0
+    rows_written = 0
+    rollup = None
+    # profiles whose views have all been read, and the one being read
+    finished, current = set(), None
+
+    with pd.read_csv(filepath, usecols=RAW_COLUMNS, chunksize=chunksize) as chunks:
+        for chunk in chunks:
+            names = chunk["Profile Name"]
+            for profile in names[names.ne(names.shift())]:
+                if profile == current:
+                    continue
+                if profile in finished:
+                    raise ValueError(f"{profile}'s views aren't all together in {filepath}, "
+                                     f"use read_and_clean instead ({rows_written} rows were "
+                                     f"written to {output_path} before this was found)")
+                if current is not None:
+                    finished.add(current)
+                current = profile
+            views = convert_times(filter_views(chunk, profiles))
+            if carried is not None:
+                views = pd.concat([carried, views], ignore_index=True)
+            sessions = find_binge_sessions(views)
+
+            # the last profile's oldest session so far may carry on into the
+            # next chunk, so hold it back until that chunk is read
+            last_profile = sessions["Profile Name"].iloc[-1:]
+            profile_sessions = sessions[ (sessions["Profile Name"].isin(last_profile)) ]
+            held = sessions["Session ID"] == profile_sessions["Session ID"].min()
+            carried = views[held]
+            final_df = _write_sessions(sessions[~held], next_session, rows_written,
+                                       title_rules, title_cache, output_path,
+                                       timezones)
+            next_session += sessions.loc[~held, "Session ID"].nunique()
+            rows_written += len(final_df)
+            if rollup_path:
+                rollup = update_rollup(rollup, final_df)
+
+    if carried is not None and len(carried):
+        final_df = _write_sessions(find_binge_sessions(carried), next_session,
+                                   rows_written, title_rules, title_cache,
+                                   output_path, timezones)
+        rows_written += len(final_df)
+        if rollup_path:
+            rollup = update_rollup(rollup, final_df)
+
+    if rollup is not None:
+        write_cleaned(rollup, rollup_path)
+    return rows_written
+
+def _write_sessions(sessions, next_session, rows_written, title_rules,
+                    title_cache, output_path, timezones):
+    # renumber sessions to follow on from those already written
+    sessions = sessions.assign(**{"Session ID": next_session +
+        pd.factorize(sessions["Session ID"], sort=True)[0]})
+    final_df = finish_views(sessions, title_rules, title_cache, timezones)
+    if len(final_df):
+        write_cleaned(final_df, output_path, append=rows_written > 0)
     return final_df
 
+@stage
+def update_cleaned(filepath, profiles=None, title_rules=None, title_cache=None,
+                   output_path=OUTPUT_PATH, state_path=None, timezones=None):
+    """
+    Cleans only the views added to a Netflix export since it was last
+    cleaned, and merges them into the cleaned data already saved. The latest
+    binge of each profile is worked out again in case the new views carry
+    it on. If views that were already cleaned have changed, or new views
+    start before a profile's last cleaned view, everything is cleaned again
+
+    Input:
+        filepath (filepath): csv filepath
+        profile (list of str): profile name(s) to filter
+        title_rules (list of dict): rules for splitting titles, see
+            parse_titles.TITLE_RULES
+        title_cache (filepath): json file to keep parsed titles in between runs
+        output_path (filepath): cleaned data to update, as .csv, .parquet or
+            .feather
+        state_path (filepath): .npz file recording what has been cleaned,
+            defaults to output_path with .state.npz added
+        timezones (dict): timezone of each profile not in TIMEZONE, used for
+            its start year, month, day, hour and minute
+
+    Returns (int): number of cleaned rows added or redone
+    """
+    state_path = state_path or output_path + ".state.npz"
+    data = read_export(filepath)
+    data = filter_views(data, profiles)
+    # views are matched up between exports by a hash of their contents, so
+    # only new views need their times parsed
+    row_hashes = pd.util.hash_pandas_object(data, index=False).to_numpy()
+
+    profile_state, next_session = {}, 0
+    if os.path.exists(state_path) and os.path.exists(output_path):
+        with np.load(state_path) as saved:
+            done = np.isin(row_hashes, saved["hashes"])
+            redo = np.isin(row_hashes, saved["boundary_hashes"])
+            if done.sum() == len(saved["hashes"]):
+                profile_state = json.loads(saved["profiles"].item())
+                next_session = int(saved["next_session"])
+            else:
+                print("Already cleaned views have changed, cleaning everything again")
+    if not profile_state:
+        done = redo = np.zeros(len(data), dtype=bool)
+    elif done.all():
+        return 0
+
+    # redo each profile's latest binge along with the new views
+    todo = ~done | redo
+    views = convert_times(data[todo]).assign(**{"Row Hash": row_hashes[todo]})
+    watermark = pd.to_datetime(views["Profile Name"].map(
+        {profile: latest["watermark"] for profile, latest in profile_state.items()}),
+        utc=True)
+    if (views["Start Time"][~redo[todo]] <= watermark[~redo[todo]]).any():
+        print("New views are older than ones already cleaned, cleaning everything again")
+        profile_state, next_session = {}, 0
+        done = redo = np.zeros(len(data), dtype=bool)
+        views = convert_times(data).assign(**{"Row Hash": row_hashes})
+
+    sessions = find_binge_sessions(views)
+    sessions["Session ID"] += next_session
+    final_df = finish_views(sessions, title_rules, title_cache, timezones)
+
+    redone = [profile_state[profile]["session_id"]
+              for profile in sessions["Profile Name"].unique()
+              if profile in profile_state]
+    if not profile_state:
+        write_cleaned(final_df, output_path)
+    elif get_format(output_path) == ".parquet":
+        # only the partitions holding the new views need rewriting
+        cleaned = read_cleaned(output_path, start_year=final_df["Start Year"].min(),
+                               profiles=list(final_df["Profile Name"].unique()))
+        cleaned = cleaned[ (~cleaned["Session ID"].isin(redone)) ]
+        write_cleaned(pd.concat([final_df, cleaned]), output_path,
+                      replace_partitions=True)
+    else:
+        cleaned = read_cleaned(output_path)
+        cleaned = cleaned[ (~cleaned["Session ID"].isin(redone)) ]
+        merged = pd.concat([final_df, cleaned.astype({"Profile Name": str})])
+        # keep profiles together, newest views first, like a full clean
+        write_cleaned(merged.sort_values(by="Profile Name", kind="stable"),
+                      output_path)
+
+    # the watermark is each profile's latest view, and its latest binge is
+    # the boundary that may need redoing next time
+    latest = sessions.sort_values(by="Start Time").groupby("Profile Name").last()
+    boundary = sessions[ (sessions["Session ID"].isin(latest["Session ID"])) ]
+    for profile, row in latest.iterrows():
+        profile_state[profile] = {"watermark": row["Start Time"].isoformat(),
+                                  "session_id": int(row["Session ID"])}
+    with open(state_path, "wb") as f:
+        np.savez(f, hashes=row_hashes, boundary_hashes=boundary["Row Hash"].to_numpy(),
+                 profiles=json.dumps(profile_state),
+                 next_session=sessions["Session ID"].max() + 1)
+    return len(final_df)
+
 if __name__ == "__main__":
-    file_path = input("What filepath should we clean? \n").strip()
-    try:
-        f = open(file_path)
-    except:
-        print("path invalid, try a different path")
-        exit()
-    
-    data = pd.read_csv(file_path)
-    users = data["Profile Name"].unique()
-
-    user_question = "\nWhat user should we focus on?\n"
-    user_detail_1 = "Please ener profile name(s) seperated by a comma and space "
-    user_detail_2 = "or 'None' to look at all users)\n"
-
-    user_input = input(f"{user_question}{user_detail_1}{user_detail_2}")
-    users = list(user_input.split(", "))
-    while not data["Profile Name"].isin(users).any():
-        print("users not found, please try again")
-        user_input = input(f"{user_question}{user_detail_1}{user_detail_2}")
-        users = list(user_input.split(", "))
-    read_and_clean(file_path, users)
-    print("complete")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Clean a Netflix ViewingActivity export")
+    parser.add_argument("filepath", help="ViewingActivity csv to clean")
+    parser.add_argument("--profiles", nargs="+", help="profile name(s) to keep (default: all)")
+    parser.add_argument("--output", help="where to save the cleaned data, as .csv, .parquet "
+                        "or .feather (default: output.csv next to the export)")
+    parser.add_argument("--rollup", help="where to also save a rollup of the cleaned data")
+    parser.add_argument("--title-rules", help="json file of extra rules for splitting titles")
+    parser.add_argument("--timezone", nargs=2, action="append", metavar=("PROFILE", "TIMEZONE"),
+                        help="timezone of a profile not watching in " + TIMEZONE)
+    parser.add_argument("--chunksize", type=int,
+                        help="read and write this many rows at a time, for big exports")
+    parser.add_argument("--update", action="store_true",
+                        help="only clean views added since the output was last cleaned")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="parse the export again rather than reusing the cache of it "
+                        "saved next to it by the last run")
+    parser.add_argument("--timings", action="store_true", help="report how long each step took")
+    parser.add_argument("--trace", help="save the time, rows and memory of each stage to this file")
+    parser.add_argument("--trace-format", default="json", choices=TRACE_FORMATS,
+                        help="json list of stages, or chrome for chrome://tracing")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="also trace peak memory, which slows things down")
+    args = parser.parse_args()
+    if args.trace:
+        start_recording(args.trace_memory)
+    if not os.path.exists(args.filepath):
+        parser.error("path invalid, try a different path")
+    # the cache is only used when cleaning the whole export at once
+    cache = not (args.no_cache or args.update or args.chunksize)
+    if args.profiles:
+        data = read_export(args.filepath, ["Profile Name"], cache)
+        if not data["Profile Name"].isin(args.profiles).any():
+            parser.error("users not found, please try again")
+
+    output_path = args.output or os.path.join(os.path.dirname(args.filepath), OUTPUT_PATH)
+    title_cache = os.path.join(os.path.dirname(args.filepath), "title_cache.json")
+    title_rules = load_title_rules(args.title_rules) if args.title_rules else None
+    timezones = dict(args.timezone) if args.timezone else None
+
+    start = time.perf_counter()
+    if args.update:
+        rows = update_cleaned(args.filepath, args.profiles, title_rules, title_cache,
+                              output_path, timezones=timezones)
+    elif args.chunksize:
+        rows = stream_and_clean(args.filepath, args.profiles, title_rules, title_cache,
+                                output_path, args.chunksize, args.rollup, timezones)
+    else:
+        rows = len(read_and_clean(args.filepath, args.profiles, title_rules, title_cache,
+                                  output_path, args.rollup, timezones, cache=cache))
+    print(f"complete, {rows} views cleaned into {output_path}")
+    if args.timings:
+        print(f"imports {_import_seconds:.2f}s, cleaning {time.perf_counter() - start:.2f}s, "
+              f"total {time.perf_counter() - _import_start:.2f}s")
+    if args.trace:
+        records = stop_recording()
+        write_trace(records, args.trace, args.trace_format)
+        print(summarize(records))
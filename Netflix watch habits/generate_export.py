@@ -0,0 +1,199 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+EXPORT_COLUMNS = ["Profile Name", "Start Time", "Duration", "Attributes", "Title",
+                  "Supplemental Video Type", "Device Type", "Bookmark", "Latest Bookmark",
+                  "Country"]
+DEVICES = ["Apple iPhone XR", "Apple iPhone 13", "Apple iPad 4 WiFi", "FireTV Stick 2016",
+           "Comcast X1 ARM WITH SAGE MVPD STB", "Roku 4K Streaming Stick", "Samsung 2019 UHD TV",
+           "LG 2020 OLED TV", "Safari MAC (Cadmium)", "Netflix Chrome MAC (Cadmium) HTML 5",
+           "Netflix Windows App - Cadmium", "Sony PS4", "Chromecast with Google TV",
+           "Android DefaultWidevineL3Phone"]
+SUPPLEMENTAL_TYPES = ["HOOK", "TRAILER", "TEASER_TRAILER", "PROMOTIONAL", "RECAP", "PREVIEW"]
+ATTRIBUTES = ["Autoplayed: user action: None; ", "Autoplayed: user action: Unspecified; ",
+              "Autoplayed: user action: User_Interaction; "]
+WORDS = ["Night", "Office", "House", "Crown", "Stranger", "Dark", "Wing", "Girls", "Love",
+         "Island", "Queen", "Lost", "City", "Secret", "Last", "Kingdom", "Fire", "Blue",
+         "Friends", "Summer", "Mind", "Hunter", "Witch", "Ozark", "Town", "Money", "Heist",
+         "Blood", "Road", "Star", "Garden", "Winter", "Brothers", "Sisters", "Code", "Game"]
+ROWS_PER_PROFILE = 20000 # views per profile when the number of profiles isn't given
+START, END = "2015-01-01", "2024-01-01"
+CHUNK_ROWS = 1000000 # views generated and written at a time
+NETFLIX_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+EXCEL_TIME_FORMAT = "%m/%d/%Y %H:%M"
+
+def make_catalogue(rng, number_shows=300):
+    """
+    Makes up a catalogue of series and films, with titles laid out like
+    Netflix's: "Show: Season 2: Episode Name (Episode 4)", with colons in
+    some show and episode names
+
+    Input:
+        rng (np.random.Generator): random numbers to use
+        number_shows (int): series and films to make
+
+    Returns (dict): titles (np.array of str), first title, number of
+        episodes, trailer title, episode minutes and popularity of each show
+    """
+    titles, first, episodes, trailers = [], [], [], []
+    for i in range(number_shows):
+        name = " ".join(rng.choice(WORDS, rng.integers(1, 4)))
+        if rng.random() < 0.15:
+            name += ": " + rng.choice(WORDS) # e.g. Twentysomethings: Austin
+        first.append(len(titles))
+        trailers.append(f"Season 1 Trailer: {name} {i}")
+        if rng.random() < 0.25:
+            titles.append(f"{name} {i}") # a film
+        else:
+            for season in range(1, rng.integers(1, 6) + 1):
+                for episode in range(1, rng.integers(6, 23) + 1):
+                    episode_name = " ".join(rng.choice(WORDS, 2))
+                    if rng.random() < 0.1:
+                        episode_name = f"Part {episode}: {episode_name}"
+                    titles.append(f"{name} {i}: Season {season}: {episode_name} (Episode {episode})")
+        episodes.append(len(titles) - first[-1])
+    popularity = 1 / np.arange(1, number_shows + 1) # a few shows are watched the most
+    return {"titles": np.array(titles, dtype=object), "first": np.array(first),
+            "episodes": np.array(episodes), "trailers": np.array(trailers, dtype=object),
+            "minutes": rng.choice([22, 30, 45, 60], number_shows) + 90 * (np.array(episodes) == 1),
+            "popularity": popularity / popularity.sum()}
+
+# every duration up to 6 hours as h:mm:ss, so durations are looked up rather
+# than formatted one by one
+DURATION_TEXT = np.array([f"{s // 3600}:{s // 60 % 60:02}:{s % 60:02}" for s in range(6 * 3600)],
+                         dtype=object)
+
+def _times_as_text(times, time_format):
+    if time_format == NETFLIX_TIME_FORMAT:
+        # much quicker than strftime
+        text = np.datetime_as_string(times.tz_localize(None).to_numpy(), unit="s")
+        return np.char.replace(text, "T", " ")
+    return times.strftime(time_format)
+
+def generate_views(rng, catalogue, profile, rows, end, span_seconds, devices,
+                   time_format=NETFLIX_TIME_FORMAT):
+    """
+    Makes up one profile's views, newest first. Views come in sessions of
+    consecutive episodes a few seconds apart, with trailers and the odd
+    short or resumed view mixed in
+
+    Input:
+        rng (np.random.Generator): random numbers to use
+        catalogue (dict): output of make_catalogue
+        profile (str): profile name
+        rows (int): views to make
+        end (pd.timestamp): when the newest view ends
+        span_seconds (float): how far back the profile's views go in total
+        devices (np.array of str): the three devices the profile watches on,
+            most used first
+        time_format (str): start time layout
+
+    Returns (tuple): views as a dataframe, and when the oldest view starts
+    """
+    sessions = rng.geometric(0.35, rows) # episodes per session
+    session = np.repeat(np.arange(rows), sessions)[:rows]
+    new_session = np.r_[True, session[1:] != session[:-1]]
+
+    # each session watches a show from a random episode on, sometimes
+    # resuming the same episode
+    show = rng.choice(len(catalogue["first"]), rows, p=catalogue["popularity"])[session]
+    first_episode = rng.integers(0, 1 << 30, rows)[session] % catalogue["episodes"][show]
+    step = np.where(new_session, 0, rng.random(rows) > 0.08).cumsum()
+    step -= np.maximum.accumulate(np.where(new_session, step, 0))
+    episode = (first_episode + step) % catalogue["episodes"][show]
+    titles = catalogue["titles"][catalogue["first"][show] + episode]
+
+    seconds = catalogue["minutes"][show] * 60
+    seconds = np.where(rng.random(rows) < 0.7, seconds * rng.uniform(0.9, 1, rows),
+                       seconds * rng.random(rows)).astype(np.int64)
+    supplemental = np.full(rows, np.nan, dtype=object)
+    trailer = rng.random(rows) < 0.05
+    supplemental[trailer] = rng.choice(SUPPLEMENTAL_TYPES, trailer.sum())
+    seconds[trailer] = rng.integers(3, 90, trailer.sum())
+    titles[trailer] = catalogue["trailers"][show[trailer]]
+
+    # sessions are spread over the profile's span, with episodes in a
+    # session starting within a minute of the last one ending
+    mean_gap = max(span_seconds / max(new_session.sum(), 1) - seconds.mean(), 60)
+    gaps = np.where(new_session, rng.exponential(mean_gap, rows), rng.integers(0, 60, rows))
+    starts = np.cumsum(gaps + np.r_[0, seconds[:-1]])
+    starts = end - pd.to_timedelta(starts[-1] + seconds[-1] - starts, unit="s")
+
+    bookmark = DURATION_TEXT[np.minimum(seconds + rng.integers(0, 600, rows), seconds.max())]
+    views = pd.DataFrame({
+        "Profile Name": profile,
+        "Start Time": _times_as_text(starts.floor("s"), time_format),
+        "Duration": DURATION_TEXT[seconds],
+        "Attributes": np.where(rng.random(rows) < 0.35, rng.choice(ATTRIBUTES, rows), ""),
+        "Title": titles,
+        "Supplemental Video Type": supplemental,
+        "Device Type": devices[rng.choice(len(devices), rows, p=[0.6, 0.3, 0.1])[session]],
+        "Bookmark": bookmark,
+        "Latest Bookmark": np.where(rng.random(rows) < 0.1, "Not latest view", bookmark),
+        "Country": "US (United States)"})
+    return views.iloc[::-1], starts[0] - pd.Timedelta(seconds=rng.exponential(mean_gap))
+
+def generate_export(path, rows, profiles=None, seed=0, time_format=NETFLIX_TIME_FORMAT,
+                    chunk_rows=CHUNK_ROWS):
+    """
+    Writes a made up Netflix ViewingActivity export of any size, the same
+    every time for the same seed. Views are grouped by profile and newest
+    first like a real export, and are written a chunk at a time so memory
+    use doesn't grow with rows
+
+    Input:
+        path (filepath): csv to write
+        rows (int): views to write
+        profiles (int): profiles to spread the views over, defaults to one
+            per ROWS_PER_PROFILE views
+        seed (int): random seed
+        time_format (str): start time layout, Netflix's by default
+        chunk_rows (int): views to make and write at a time
+
+    Returns (int): views written
+    """
+    rng = np.random.default_rng(seed)
+    catalogue = make_catalogue(rng)
+    profiles = profiles or max(1, -(-rows // ROWS_PER_PROFILE))
+    # some profiles watch far more than others
+    shares = rng.pareto(1.5, profiles) + 1
+    profile_rows = np.floor(shares / shares.sum() * rows).astype(np.int64)
+    profile_rows[:rows - profile_rows.sum()] += 1
+    end = pd.Timestamp(END, tz="UTC")
+    span = (end - pd.Timestamp(START, tz="UTC")).total_seconds()
+
+    written = 0
+    with open(path, "w", newline="") as f:
+        f.write(",".join(EXPORT_COLUMNS) + "\n")
+        for number, profile_total in enumerate(profile_rows):
+            profile = f"Profile {number}" if number else "Kids"
+            devices = np.array(DEVICES)[rng.choice(len(DEVICES), 3, replace=False)]
+            newest, done = end - pd.Timedelta(hours=rng.exponential(48)), 0
+            while done < profile_total:
+                rows_now = min(chunk_rows, profile_total - done)
+                views, newest = generate_views(rng, catalogue, profile, rows_now, newest,
+                                               span * rows_now / profile_total, devices,
+                                               time_format)
+                views.to_csv(f, header=False, index=False)
+                done += rows_now
+            written += done
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a made up Netflix ViewingActivity export")
+    parser.add_argument("path", help="csv to write")
+    parser.add_argument("rows", type=int, help="views to write")
+    parser.add_argument("--profiles", type=int, help=f"profiles (default: one per "
+                        f"{ROWS_PER_PROFILE} views)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--excel-times", action="store_true",
+                        help="write start times like an export re-saved by Excel")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = generate_export(args.path, args.rows, args.profiles, args.seed,
+                           EXCEL_TIME_FORMAT if args.excel_times else NETFLIX_TIME_FORMAT)
+    seconds = time.perf_counter() - start
+    print(f"Wrote {rows} views to {args.path} in {seconds:.1f}s ({rows / seconds:.0f} views per second)")
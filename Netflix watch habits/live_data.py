@@ -0,0 +1,371 @@
+import argparse
+import csv
+import json
+import queue
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from clean_data import BINGE_GAP, START_TIME_FORMATS, parse_start_times, read_export
+from store_data import MINUTE_SCALE, TIMEZONE
+
+WINDOWS = {"7 days": timedelta(days=7), "30 days": timedelta(days=30)}
+HEATMAP_WINDOW = "30 days" # window the hour of day heatmap covers
+SHORT_VIEW = timedelta(seconds=30) # views this short are dropped, as in filter_views
+POLL_SECONDS = 1.0
+
+def parse_start_time(text):
+    """
+    Parses one start time from a Netflix export, like
+    clean_data.parse_start_times does for a whole column
+
+    Input:
+        text (str): start time, in UTC
+
+    Returns (datetime): start time in UTC, without a timezone
+    """
+    try:
+        # Netflix's own layout, and much quicker than strptime
+        return datetime.fromisoformat(text)
+    except ValueError:
+        pass
+    for time_format in START_TIME_FORMATS[1:]:
+        try:
+            return datetime.strptime(text, time_format)
+        except ValueError:
+            continue
+    raise ValueError(f"Start time {text} isn't one of {START_TIME_FORMATS}")
+
+def parse_duration(text):
+    """
+    Parses one view duration, like 0:42:13
+
+    Input:
+        text (str): duration
+
+    Returns (timedelta): duration
+    """
+    hours, minutes, seconds = text.split(":")
+    return timedelta(hours=int(hours), minutes=int(minutes), seconds=int(seconds))
+
+def _is_set(value):
+    # missing fields come as "" from a csv, but as None or NaN from elsewhere,
+    # e.g. rows of a dataframe
+    return isinstance(value, str) and value != ""
+
+def _round(minutes):
+    # rounds to 2 decimals the way pandas does in read_and_clean
+    return round(minutes * 100) / 100
+
+class _Window:
+    """
+    Views and binges of one profile in a sliding window, with their totals
+    kept as they come and go. Minutes are kept in whole hundredths (see
+    store_data.MINUTE_SCALE) so that totals don't drift
+    """
+    __slots__ = ("length", "views", "minutes", "binges", "binge_minutes", "longest")
+
+    def __init__(self, length):
+        self.length = length
+        self.views, self.minutes = deque(), 0
+        self.binges, self.binge_minutes = deque(), 0
+        # binges that could still be the longest, longest first, so the
+        # longest is always at the front
+        self.longest = deque()
+
+    def add_view(self, start, minutes, cell):
+        self.views.append((start, minutes, cell))
+        self.minutes += minutes
+
+    def add_binge(self, start, minutes):
+        self.binges.append((start, minutes))
+        self.binge_minutes += minutes
+        while self.longest and self.longest[-1][1] <= minutes:
+            self.longest.pop()
+        self.longest.append((start, minutes))
+
+    def expire(self, now, heatmap=None):
+        # each view and binge is dropped once, so this is O(1) amortized
+        cutoff = now - self.length
+        while self.views and self.views[0][0] <= cutoff:
+            _, minutes, cell = self.views.popleft()
+            self.minutes -= minutes
+            if heatmap is not None:
+                heatmap[cell] -= minutes
+        while self.binges and self.binges[0][0] <= cutoff:
+            self.binge_minutes -= self.binges.popleft()[1]
+        while self.longest and self.longest[0][0] <= cutoff:
+            self.longest.popleft()
+
+    def summary(self, ended=None):
+        # a binge that has ended but not been closed yet counts too
+        binges, binge_minutes = len(self.binges), self.binge_minutes
+        longest = self.longest[0][1] if self.longest else 0
+        if ended is not None:
+            binges, binge_minutes, longest = binges + 1, binge_minutes + ended, max(longest, ended)
+        return {"minutes": self.minutes / MINUTE_SCALE, "views": len(self.views),
+                "binges": binges, "binge minutes": binge_minutes / MINUTE_SCALE,
+                "longest binge": longest / MINUTE_SCALE}
+
+class _Profile:
+    """
+    One profile's open session, sliding windows and heatmap
+    """
+    __slots__ = ("zone", "last_start", "last_end", "last_kept", "session_start",
+                 "session_minutes", "session_views", "session_title", "windows", "heatmap")
+
+    def __init__(self, zone, windows):
+        self.zone = zone
+        self.last_start = self.last_end = self.session_start = self.session_title = None
+        self.last_kept, self.session_minutes, self.session_views = False, 0.0, 0
+        self.windows = {name: _Window(length) for name, length in windows.items()}
+        # minutes in hundredths by day of week (Monday first) and hour
+        self.heatmap = [0] * (7 * 24)
+
+class LiveHabits:
+    """
+    Watch habits kept up to date one viewing event at a time, for live
+    dashboards: time watched, views and binges in sliding windows (the last
+    7 and 30 days by default), the binge being watched now, and a heatmap
+    of the last 30 days by day of week and hour. Binges follow the rule
+    read_and_clean uses: a view starting no more than BINGE_GAP after the
+    last one ended carries on its session, very short views count towards
+    the session but are then dropped, and the binge is kept on the
+    session's last view. Each profile's views must come in order of start
+    time: a view starting before the profile's last one is counted as late
+    and skipped. Each event takes O(1) amortized time, and memory only
+    grows with the views inside the longest window
+    """
+    def __init__(self, windows=WINDOWS, gap=BINGE_GAP, timezones=None, profiles=None):
+        """
+        Input:
+            windows (dict): length (timedelta) of each sliding window, by name
+            gap (timedelta): longest break allowed within a session
+            timezones (dict): timezone of each profile not in TIMEZONE, used
+                for its heatmap
+            profiles (list of str): profile name(s) to keep, defaults to all
+        """
+        assert HEATMAP_WINDOW in windows, print(f"Needs a {HEATMAP_WINDOW} window for the heatmap")
+        self.window_lengths, self.gap = windows, gap
+        self.timezones = timezones or {}
+        self.profiles = set(profiles) if profiles else None
+        self._profiles = {}
+        self.now = None
+        self.events, self.skipped, self.late = 0, 0, 0
+
+    def add(self, event):
+        """
+        Takes in one viewing event
+
+        Input:
+            event (dict): one row of a Netflix export, with at least
+                clean_data.RAW_COLUMNS
+
+        Returns (bool): whether the view was counted; supplemental videos,
+            other profiles and views older than their profile's last are not
+        """
+        self.events += 1
+        profile = event["Profile Name"]
+        if _is_set(event.get("Supplemental Video Type")) or \
+                (self.profiles is not None and profile not in self.profiles):
+            self.skipped += 1
+            return False
+        return self.add_view(profile, parse_start_time(event["Start Time"]),
+                             parse_duration(event["Duration"]), event["Title"])
+
+    def add_view(self, profile, start, duration, title):
+        """
+        Takes in one view that has already been parsed
+
+        Input:
+            profile (str): profile name
+            start (datetime): start time in UTC, without a timezone
+            duration (timedelta): how long was watched
+            title (str): title watched
+
+        Returns (bool): whether the view was counted, as views must come in
+            order of start time for each profile
+        """
+        stats = self._profiles.get(profile)
+        if stats is None:
+            zone = ZoneInfo(self.timezones.get(profile, TIMEZONE))
+            stats = self._profiles[profile] = _Profile(zone, self.window_lengths)
+        elif start < stats.last_start:
+            self.late += 1
+            return False
+
+        if stats.last_end is None or start - stats.last_end > self.gap:
+            self._close_session(stats)
+            stats.session_start, stats.session_minutes, stats.session_views = start, 0.0, 0
+        minutes = _round(duration.seconds / 60)
+        stats.session_minutes += minutes
+        stats.session_views += 1
+        stats.session_title = title
+        stats.last_start, stats.last_end = start, start + duration
+        stats.last_kept = duration > SHORT_VIEW
+        self.now = max(self.now, stats.last_end) if self.now else stats.last_end
+
+        if stats.last_kept:
+            local = start.replace(tzinfo=timezone.utc).astimezone(stats.zone)
+            cell = local.weekday() * 24 + local.hour
+            hundredths = round(minutes * MINUTE_SCALE)
+            stats.heatmap[cell] += hundredths
+            for window in stats.windows.values():
+                window.add_view(start, hundredths, cell)
+        self._expire(stats, start)
+        return True
+
+    def _session_binge(self, stats):
+        # the session's binge is only kept if its last view is, as in
+        # read_and_clean, and is dated by that view
+        if stats.session_views and stats.last_kept:
+            return round(_round(stats.session_minutes) * MINUTE_SCALE)
+        return None
+
+    def _close_session(self, stats):
+        binge = self._session_binge(stats)
+        if binge is not None:
+            for window in stats.windows.values():
+                window.add_binge(stats.last_start, binge)
+        stats.session_views = 0
+
+    def _expire(self, stats, now):
+        for name, window in stats.windows.items():
+            window.expire(now, stats.heatmap if name == HEATMAP_WINDOW else None)
+
+    def snapshot(self, now=None):
+        """
+        Summarises every profile's watching as of a time. Views and binges
+        that have left the windows by then are dropped for good, as they are
+        when views come in, so this changes what is kept
+
+        Input:
+            now (datetime): time in UTC, without a timezone, that windows
+                end at; defaults to the end of the latest view taken in.
+                It shouldn't go back between snapshots, as views dropped by
+                an earlier one are gone
+
+        Returns (dict): by profile, the minutes, views, binges, binge
+            minutes and longest binge of each window, the binge being
+            watched now (or None), and the heatmap of minutes by day of
+            week (Monday first) and hour
+        """
+        now = now or self.now
+        summaries = {}
+        for profile, stats in self._profiles.items():
+            current, ended = None, None
+            if stats.session_views and now - stats.last_end <= self.gap:
+                current = {"title": stats.session_title, "views": stats.session_views,
+                           "minutes": _round(stats.session_minutes),
+                           "since": stats.session_start.isoformat()}
+            else:
+                # nothing has carried the session on in time, so it is
+                # over, though only the profile's next view closes it
+                ended = self._session_binge(stats)
+            self._expire(stats, now)
+            summaries[profile] = {
+                **{name: window.summary(ended if stats.last_start > now - window.length else None)
+                   for name, window in stats.windows.items()},
+                "current binge": current,
+                "heatmap": [[minutes / MINUTE_SCALE for minutes in stats.heatmap[day * 24:day * 24 + 24]]
+                            for day in range(7)]}
+        return summaries
+
+def tail_csv(filepath, follow=True, poll_seconds=POLL_SECONDS):
+    """
+    Reads viewing events from a csv as lines are added to it, like tail -f
+
+    Input:
+        filepath (filepath): csv with a Netflix export header, added to
+            oldest view first
+        follow (bool): keep waiting for new lines at the end of the file,
+            rather than stopping there
+        poll_seconds (float): how often to check for new lines
+
+    Returns (generator of dict): one event per row
+    """
+    with open(filepath, newline="") as f:
+        header = next(csv.reader([f.readline()]))
+        partial = ""
+        while True:
+            line = f.readline()
+            if not line.endswith("\n"):
+                # the end of the file, or a line still being written
+                partial += line
+                if not follow:
+                    break
+                time.sleep(poll_seconds)
+                continue
+            line, partial = partial + line, ""
+            if line.strip():
+                yield dict(zip(header, next(csv.reader([line]))))
+        if partial.strip():
+            yield dict(zip(header, next(csv.reader([partial]))))
+
+def queue_events(events, timeout=None):
+    """
+    Reads viewing events put on a queue, e.g. by another thread standing in
+    for a message queue, until None is put on it
+
+    Input:
+        events (queue.Queue): events as dicts, then None
+        timeout (float): longest to wait for an event, defaults to forever
+
+    Returns (generator of dict): the events
+    """
+    while True:
+        try:
+            event = events.get(timeout=timeout)
+        except queue.Empty:
+            return
+        if event is None:
+            return
+        yield event
+
+def replay_export(filepath):
+    """
+    Replays a Netflix export as a live feed, oldest view first. Exports
+    list each profile's views newest first, so the export is read whole
+
+    Input:
+        filepath (filepath): csv filepath
+
+    Returns (generator of dict): one event per view, in order of start time
+    """
+    data = read_export(filepath)
+    # later rows go first on tied start times, as find_binge_sessions orders them
+    order = parse_start_times(data["Start Time"]).iloc[::-1].sort_values(kind="stable").index
+    data = data.loc[order]
+    for row in data.itertuples(index=False, name=None):
+        yield dict(zip(data.columns, row))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep rolling watch habits up to date from a "
+                                     "live feed of viewing events")
+    parser.add_argument("filepath", help="csv of viewing events, added to oldest first")
+    parser.add_argument("--follow", action="store_true",
+                        help="keep waiting for new events at the end of the file")
+    parser.add_argument("--replay", action="store_true",
+                        help="replay a Netflix export (newest first) oldest view first")
+    parser.add_argument("--profiles", nargs="+", help="profile name(s) to keep (default: all)")
+    parser.add_argument("--timezone", nargs=2, action="append", metavar=("PROFILE", "TIMEZONE"),
+                        help="timezone of a profile not watching in " + TIMEZONE)
+    parser.add_argument("--every", type=int, default=0,
+                        help="print the habits every this many events as well as at the end")
+    parser.add_argument("--poll", type=float, default=POLL_SECONDS,
+                        help="seconds between checks for new events when following")
+    args = parser.parse_args()
+
+    habits = LiveHabits(timezones=dict(args.timezone) if args.timezone else None,
+                        profiles=args.profiles)
+    events = replay_export(args.filepath) if args.replay else \
+        tail_csv(args.filepath, args.follow, args.poll)
+    start = time.perf_counter()
+    for event in events:
+        habits.add(event)
+        if args.every and habits.events % args.every == 0:
+            print(json.dumps(habits.snapshot()))
+    seconds = time.perf_counter() - start
+    print(json.dumps(habits.snapshot(), indent=1))
+    print(f"{habits.events} events ({habits.skipped} skipped, {habits.late} late) in "
+          f"{seconds:.2f}s ({habits.events / max(seconds, 1e-9):.0f} events per second)")
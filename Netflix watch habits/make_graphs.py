@@ -1,17 +1,23 @@
-import matplotlib.pyplot as plt
-from numpy import datetime_data
-import seaborn as sns
+import time
+_import_start = time.perf_counter()
+import argparse
+import os
+from collections import OrderedDict
 import pandas as pd
+from rank_data import RANK_COLUMNS, RankIndex
+from rollup_data import ROLLUP_DIMENSIONS
+from store_data import MINUTE_SCALE, read_cleaned
+from time_stages import (TRACE_FORMATS, record_rows_in, stage, start_recording,
+                         stop_recording, summarize, write_trace)
+_import_seconds = time.perf_counter() - _import_start
 
-sns.set_style('darkgrid') # darkgrid, white grid, dark, white and ticks
-colors = sns.color_palette("dark") # set color pallete
-plt.rc('axes', titlesize=18)     # fontsize of the axes title
-plt.rc('axes', labelsize=12)    # fontsize of the x and y labels
-plt.rc('xtick', labelsize=9)    # fontsize of the tick labels
-plt.rc('ytick', labelsize=9)    # fontsize of the tick labels
-plt.rc('legend', fontsize=12)    # legend fontsize
-plt.rc('font', size=12)          # controls default text sizes
-plt.figure(figsize=(8,4), tight_layout=True) # size of plot
+FIGURE_SIZE = (8, 4) # size of plot
+VIEWS_KEPT = 16 # filtered views to keep cached, least recently used dropped first
+
+# matplotlib and seaborn are slow to import, so they are only loaded once a
+# chart is drawn (see load_plotting)
+plt = None
+colors = None
 
 DAY_NAMES = {0:'Mon', 1:'Tue', 2:'Wed', 3:'Thu', 4:'Fri', 5:'Sat', 6:'Sun'}
 MONTH_NAMES = {1: 'Jan', 2: 'Feb', 3: 'Mar', 4: 'Apr', 5: 'May', 6: 'Jun',
@@ -20,202 +26,515 @@ COLUMNS_TIME_DICT = {"year": 'Start Year', "month": 'Start Month',
                      "day of month": 'Start Day', "day of week": 'Start Day of Week',
                      "hour of day": 'Start Hour'}
 
-def find_time_watched(filepath, time_unit="year", start_year=None):
-    """
-    Reads in a clean csv file to analyze total Netflix watched
+TIME_UNITS = ["year", "month", "day of week", "day of month", "hour of day"]
+# where analyses run: on data loaded into pandas (WatchHistory), or as SQL
+# over the saved parquet files (sql_data.SQLHistory, needs duckdb)
+BACKENDS = ["pandas", "duckdb"]
 
-    Input:
-        filepath (filepath): csv filepath
-        time_unit (str): time_unit to slice data on
-        start_year (int): start year for data analysis
-    
-    Returns (plt bar graph): bar graph of time spent on Netflix
+class WatchHistory:
     """
-    data = pd.read_csv(filepath)
-
-    assert time_unit in ["year", "month", "day of week", "day of month", "hour of day"], \
-        print("Pick a different time unit")
+    Cleaned watch data loaded once, with recently used filtered views of it
+    cached so that many analyses can be run without re-reading the file. Given a rollup
+    (see rollup_data.py), totals and averages are found from it instead of
+    from every row. The data is kept compact (see store_data.compact_cleaned),
+    with minutes in whole hundredths until they are reported
+    """
+    def __init__(self, filepath=None, columns=None, start_year=None, rollup_path=None):
+        """
+        Input:
+            filepath (filepath): cleaned csv, feather file or parquet directory
+            columns (list of str): columns to load, defaults to all of them
+            start_year (int): earliest year to load
+            rollup_path (filepath): rollup of the cleaned data to load
+        """
+        assert filepath or rollup_path, print("Needs cleaned data or a rollup")
+        self.data, self.rollup = None, None
+        # the rows and rollup share string tables, so their codes match
+        tables = {}
+        if filepath:
+            self.data = read_cleaned(filepath, columns, start_year, compact=True,
+                                     tables=tables)
+        if rollup_path:
+            self.rollup = read_cleaned(rollup_path, start_year=start_year, compact=True,
+                                       tables=tables)
+        loaded = self.data if self.data is not None else self.rollup
+        # nothing loaded, e.g. when start_year is past the last view
+        self.min_year = int(loaded["Start Year"].min()) if len(loaded) else start_year
+        self._views = OrderedDict()
+        self._ranks = None
+
+    def view(self, start_year=None, profiles=None, rollup=False):
+        """
+        Filters the watch data, reusing the result of the last VIEWS_KEPT calls
+
+        Input:
+            start_year (int): start year for data analysis
+            profiles (list of str): profile name(s) to filter
+            rollup (bool): filter the rollup instead of the cleaned rows
+
+        Returns (pd.dataframe): watch data since start_year for profiles
+        """
+        key = (start_year, tuple(sorted(profiles)) if profiles else None, rollup)
+        if key not in self._views:
+            data = self.rollup if rollup else self.data
+            assert data is not None, print("This analysis needs the cleaned data loaded")
+            if start_year:
+                assert self.min_year is None or start_year >= self.min_year, \
+                    print("Pick a different start year")
+                data = data[ (data["Start Year"] >= start_year) ]
+            if profiles:
+                data = data[ (data["Profile Name"].isin(profiles)) ]
+            self._views[key] = data
+            if len(self._views) > VIEWS_KEPT:
+                self._views.popitem(last=False)
+        self._views.move_to_end(key)
+        record_rows_in(len(self._views[key]))
+        return self._views[key]
+
+    def clear_views(self):
+        """
+        Forgets the filtered views cached by view and the show totals of the
+        rank index, e.g. once done with a profile
+        """
+        self._views = OrderedDict()
+        if self._ranks is not None:
+            self._ranks.clear_show_totals()
+
+    @property
+    def ranks(self):
+        """
+        RankIndex of the cleaned data, built the first time it is needed
+        """
+        if self._ranks is None:
+            assert self.data is not None, print("This analysis needs the cleaned data loaded")
+            self._ranks = RankIndex(self.data)
+        return self._ranks
+
+    def _duration_view(self, start_year, profiles, col_to_use):
+        # the rollup can stand in for the rows when only minutes watched are
+        # needed, as long as it is broken down by col_to_use
+        if self.rollup is None or col_to_use not in ROLLUP_DIMENSIONS:
+            return self.view(start_year, profiles)
+        return self.view(start_year, profiles, rollup=True).rename(
+            columns={"Duration Sum (min)": "Duration (min)"})
+
+    @stage
+    def time_watched(self, time_unit="year", start_year=None, profiles=None):
+        """
+        Totals time watched by time unit
+
+        Input:
+            time_unit (str): time_unit to slice data on
+            start_year (int): start year for data analysis
+            profiles (list of str): profile name(s) to filter
+
+        Returns (pd.dataframe): minutes watched per time unit
+        """
+        return self._by_time_unit("sum", time_unit, start_year, profiles)
+
+    @stage
+    def average_time_watched(self, time_unit="year", start_year=None, profiles=None):
+        """
+        Averages time watched per session by time unit
+
+        Input:
+            time_unit (str): time_unit to slice data on
+            start_year (int): start year for data analysis
+            profiles (list of str): profile name(s) to filter
+
+        Returns (pd.dataframe): average minutes watched per time unit
+        """
+        return self._by_time_unit("mean", time_unit, start_year, profiles)
+
+    def _by_time_unit(self, how, time_unit, start_year, profiles):
+        assert time_unit in TIME_UNITS, print("Pick a different time unit")
+
+        col_to_use = COLUMNS_TIME_DICT[time_unit]
+
+        data = self._duration_view(start_year, profiles, col_to_use)
+        if "Views" in data.columns:
+            barplot = data.groupby(col_to_use)[["Duration (min)", "Views"]].sum()
+            if how == "mean":
+                barplot["Duration (min)"] /= barplot["Views"]
+            barplot = barplot[["Duration (min)"]].reset_index()
+        else:
+            data_to_use = data[[col_to_use, "Duration (min)"]]
+            barplot = data_to_use.groupby(col_to_use).agg(how).reset_index()
+        barplot["Duration (min)"] /= MINUTE_SCALE
+
+        barplot = barplot.sort_values(by = col_to_use)
+        return name_time_units(barplot, time_unit)
+
+    @stage
+    def max_binges(self, number_binges=10, start_year=None, profiles=None, offset=0):
+        """
+        Finds the longest binges
+
+        Input:
+            number_binges (int): top binges to find
+            start_year (int): start year for data analysis
+            profiles (list of str): profile name(s) to filter
+            offset (int): longest binges to skip, to page through them
+
+        Returns (pd.dataframe): title, length, date and label of top binges
+        """
+        top = self.ranks.top_binges(number_binges, start_year, profiles, offset)
+        return label_binges(top)
+
+    @stage
+    def time_watched_by_show(self, number_shows=10, start_year=None, profiles=None,
+                             offset=0):
+        """
+        Finds the shows watched the longest
+
+        Input:
+            number_shows (int): top shows to find
+            start_year (int): start year for data analysis
+            profiles (list of str): profile name(s) to filter
+            offset (int): top shows to skip, to page through them
+
+        Returns (pd.dataframe): minutes watched of top shows
+        """
+        if self.rollup is None:
+            barplot = self.ranks.top_shows(number_shows, start_year, profiles, offset)
+        else:
+            data = self._duration_view(start_year, profiles, "Title")
+            data_to_use = data[["Title", "Duration (min)"]]
+            barplot = data_to_use.groupby("Title", observed=True).sum().reset_index()
+            barplot = barplot.sort_values(by="Duration (min)", ascending=False)
+            barplot = barplot[offset:offset + number_shows]
+        return barplot.assign(**{"Duration (min)": barplot["Duration (min)"] / MINUTE_SCALE})
+
+    @stage
+    def data_by_time_frame(self, time_unit="year", start_year=None, dur_type="show",
+                           profiles=None, number_shows=1, ties=True):
+        """
+        Finds the top shows or binges in each time frame
+
+        Input:
+            time_unit (str): time_unit to slice data on
+            start_year (int): start year for data analysis
+            dur_type(str): what to find (show or binge)
+            profiles (list of str): profile name(s) to filter
+            number_shows (int): top shows or binges to find per time frame
+            ties (bool): keep everything tied with the last place kept
+
+        Returns (pd.dataframe): time frame, title, minutes and rank of the top
+            shows or binges, one row each
+        """
+        assert time_unit in TIME_UNITS, print("Pick a different time unit")
+        
+        assert dur_type in ["show", "binge"], print("Needs to be show or binge")
+
+        time_col = COLUMNS_TIME_DICT[time_unit]
 
-    min_year = min(data["Start Year"].unique())
-    if start_year:
-        assert start_year >= min_year, print("Pick a different start year")
-        data = data[ (data["Start Year"] >= start_year) ]
-    else:
-        start_year = min_year
+        if dur_type == "show":
+            duration_col = "Duration (min)"
+            data = self._duration_view(start_year, profiles, time_col)
+        else:
+            duration_col = "Binge (min)"    
+            data = self.view(start_year, profiles)
 
-    col_to_use = COLUMNS_TIME_DICT[time_unit]
+        data_to_use = data[[time_col, "Title", duration_col]]
+        if dur_type == "show":
+            data_to_use = data_to_use.groupby([time_col, "Title"], observed=True).sum().reset_index()
+        return rank_top(data_to_use, time_col, duration_col, number_shows, ties)
 
-    data_to_use = data[[col_to_use, "Duration (min)"]]
-    barplot = data_to_use.groupby(col_to_use).sum().reset_index()
-    
-    barplot = barplot.sort_values(by = col_to_use)
+def name_time_units(barplot, time_unit):
+    """
+    Names the months or days of the week an analysis is broken down by
 
+    Input:
+        barplot (pd.dataframe): analysis by time unit
+        time_unit (str): time_unit it is broken down by
 
+    Returns (pd.dataframe): analysis with month and day names
+    """
+    col_to_use = COLUMNS_TIME_DICT[time_unit]
     if time_unit == "month":
         barplot[col_to_use] = barplot[col_to_use].map(MONTH_NAMES)
     if time_unit == "day of week":
         barplot[col_to_use] = barplot[col_to_use].map(DAY_NAMES)
+    return barplot
 
-    plt.bar(barplot[col_to_use], barplot["Duration (min)"], color=colors[0])
-    plt.title("Netflix watch time by " + time_unit + " since " + str(start_year))
-    plt.ylabel("Minutes watched") 
+def label_binges(top):
+    """
+    Dates and labels the top binges
 
-    return plt.show()
+    Input:
+        top (pd.dataframe): title, binge minutes in hundredths, start year,
+            month and day of the top binges
 
-def find_average_time_watched(filepath, time_unit="year", start_year=None):
+    Returns (pd.dataframe): title, length, date and label of the binges
     """
-    Reads in a clean csv file to analyze average Netflix watched
+    # dates are only made for the binges kept
+    data_to_use = top[["Title", "Binge (min)", "Start Year", "Start Month", "Start Day"]]
+    data_to_use = data_to_use.rename(columns={"Start Year": "year", "Start Month": "month", "Start Day": "day"})
+    data_to_use["Binge (min)"] /= MINUTE_SCALE
+    data_to_use["Date"] = pd.to_datetime( data_to_use[["year", "month", "day"]] )
+    barplot = data_to_use.drop(["year", "month", "day"], axis=1)
+    barplot["Date"] = barplot["Date"].astype(str)
+    # pages past the last binge are empty, which agg can't label
+    barplot["Label"] = barplot["Title"].astype(str) + "\n" + barplot["Date"]
+    return barplot
+
+def rank_top(data_to_use, time_col, duration_col, number_shows=1, ties=True):
+    """
+    Ranks the top shows or binges in each time frame
+
+    Input:
+        data_to_use (pd.dataframe): time frame, title and minutes in
+            hundredths of each show or binge, in the order loaded
+        time_col (str): time frame column
+        duration_col (str): minutes column to rank on
+        number_shows (int): top shows or binges to find per time frame
+        ties (bool): keep everything tied with the last place kept
+
+    Returns (pd.dataframe): time frame, title, minutes and rank of the top
+        shows or binges, one row each
+    """
+    # keep the top rows of each time frame in one pass, then rank only
+    # those, tied rows sharing a rank
+    top = data_to_use.groupby(time_col)[duration_col].nlargest(
+        number_shows, keep="all" if ties else "first")
+    top = data_to_use.loc[top.index.get_level_values(-1)]
+    rank = top.groupby(time_col)[duration_col].rank(
+        method="min" if ties else "first", ascending=False)
+    top = top.assign(Rank = rank.astype(int),
+                     **{duration_col: top[duration_col] / MINUTE_SCALE})
+    return top.sort_values(by = [time_col, "Rank"]).reset_index(drop=True)
+
+def open_history(filepath, backend="pandas", rollup_path=None):
+    """
+    Opens cleaned watch data to run analyses on with one of BACKENDS
+
+    Input:
+        filepath (filepath): cleaned csv, feather file or parquet directory,
+            which must be parquet for the duckdb backend
+        backend (str): pandas to load the data into memory, or duckdb to
+            query it where it is saved
+        rollup_path (filepath): rollup of the cleaned data to load (pandas)
+
+    Returns (WatchHistory or SQLHistory): watch data to analyse
+    """
+    assert backend in BACKENDS, print(f"Pick one of {BACKENDS}")
+    if backend == "duckdb":
+        # duckdb is only needed, and imported, for this backend
+        from sql_data import SQLHistory
+        return SQLHistory(filepath)
+    return WatchHistory(filepath, rollup_path=rollup_path)
+
+def load_history(source, columns=None, start_year=None):
+    """
+    Loads cleaned watch data unless it is already loaded
+
+    Input:
+        source (filepath, WatchHistory or SQLHistory): cleaned data or its
+            filepath
+        columns (list of str): columns to load from a filepath
+        start_year (int): earliest year to load from a filepath
+
+    Returns (WatchHistory or SQLHistory): loaded watch data
+    """
+    if not isinstance(source, (str, os.PathLike)):
+        return source
+    if columns is not None:
+        # profiles are needed to filter on
+        columns = columns + ["Profile Name"]
+    return WatchHistory(source, columns, start_year)
+
+@stage
+def load_plotting():
+    """
+    Imports matplotlib and seaborn and sets the chart style, the first time
+    it is called
+
+    Returns (module): matplotlib.pyplot
+    """
+    global plt, colors
+    if plt is None:
+        import matplotlib.pyplot as pyplot
+        import seaborn as sns
+
+        sns.set_style('darkgrid') # darkgrid, white grid, dark, white and ticks
+        colors = sns.color_palette("dark") # set color pallete
+        pyplot.rc('axes', titlesize=18)     # fontsize of the axes title
+        pyplot.rc('axes', labelsize=12)    # fontsize of the x and y labels
+        pyplot.rc('xtick', labelsize=9)    # fontsize of the tick labels
+        pyplot.rc('ytick', labelsize=9)    # fontsize of the tick labels
+        pyplot.rc('legend', fontsize=12)    # legend fontsize
+        pyplot.rc('font', size=12)          # controls default text sizes
+        plt = pyplot
+    return plt
+
+def new_chart(save_path=None):
+    """
+    Makes a figure of its own for one chart. Charts being saved are drawn
+    outside of pyplot, so they need no display and are freed once saved
+
+    Input:
+        save_path (filepath): where the chart will be saved, if not shown
+
+    Returns (tuple): figure and axes to draw the chart on
+    """
+    load_plotting()
+    if save_path:
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=FIGURE_SIZE, tight_layout=True)
+        return fig, fig.subplots()
+    return plt.subplots(figsize=FIGURE_SIZE, tight_layout=True)
+
+def finish_chart(fig, save_path=None):
+    """
+    Shows a chart, or saves it to a png, svg or pdf file
+
+    Input:
+        fig (figure): output of new_chart
+        save_path (filepath): where to save the chart, its extension picks
+            the format
+
+    Returns (str): save_path, or plt.show() when shown
+    """
+    if not save_path:
+        return plt.show()
+    fig.savefig(save_path)
+    fig.clear()
+    return save_path
+
+@stage
+def find_time_watched(filepath, time_unit="year", start_year=None, profiles=None,
+                      save_path=None):
+    """
+    Reads in a clean csv file to analyze total Netflix watched
 
     Input:
-        filepath (filepath): csv filepath
+        filepath (filepath or WatchHistory): cleaned data or its filepath
         time_unit (str): time_unit to slice data on
         start_year (int): start year for data analysis
+        profiles (list of str): profile name(s) to filter
+        save_path (filepath): where to save the graph instead of showing it
     
-    Returns (plt bar graph): bar graph of average time spent on Netflix
+    Returns (plt bar graph): bar graph of time spent on Netflix
     """
-    data = pd.read_csv(filepath)
+    assert time_unit in TIME_UNITS, print("Pick a different time unit")
 
-    assert time_unit in ["year", "month", "day of week", "day of month", "hour of day"], \
-        print("Pick a different time unit")
+    history = load_history(filepath, [COLUMNS_TIME_DICT[time_unit], "Duration (min)"],
+                           start_year)
+    barplot = history.time_watched(time_unit, start_year, profiles)
+    col_to_use = COLUMNS_TIME_DICT[time_unit]
 
-    min_year = min(data["Start Year"].unique())
-    if start_year:
-        assert start_year >= min_year, print("Pick a different start year")
-        data = data[ (data["Start Year"] >= start_year) ]
-    else:
-        start_year = min_year
+    fig, ax = new_chart(save_path)
+    ax.bar(barplot[col_to_use], barplot["Duration (min)"], color=colors[0])
+    ax.set_title("Netflix watch time by " + time_unit + " since " + str(start_year or history.min_year))
+    ax.set_ylabel("Minutes watched") 
 
-    col_to_use = COLUMNS_TIME_DICT[time_unit]
+    return finish_chart(fig, save_path)
+
+@stage
+def find_average_time_watched(filepath, time_unit="year", start_year=None,
+                              profiles=None, save_path=None):
+    """
+    Reads in a clean csv file to analyze average Netflix watched
 
-    data_to_use = data[[col_to_use, "Duration (min)"]]
-    barplot = data_to_use.groupby(col_to_use).mean().reset_index()
+    Input:
+        filepath (filepath or WatchHistory): cleaned data or its filepath
+        time_unit (str): time_unit to slice data on
+        start_year (int): start year for data analysis
+        profiles (list of str): profile name(s) to filter
+        save_path (filepath): where to save the graph instead of showing it
     
-    barplot = barplot.sort_values(by = col_to_use)
+    Returns (plt bar graph): bar graph of average time spent on Netflix
+    """
+    assert time_unit in TIME_UNITS, print("Pick a different time unit")
 
-    if time_unit == "month":
-        barplot[col_to_use] = barplot[col_to_use].map(MONTH_NAMES)
-    if time_unit == "day of week":
-        barplot[col_to_use] = barplot[col_to_use].map(DAY_NAMES)
+    history = load_history(filepath, [COLUMNS_TIME_DICT[time_unit], "Duration (min)"],
+                           start_year)
+    barplot = history.average_time_watched(time_unit, start_year, profiles)
+    col_to_use = COLUMNS_TIME_DICT[time_unit]
 
-    plt.bar(barplot[col_to_use], barplot["Duration (min)"], color=colors[0])
-    plt.title("Average Netflix watch time per session by " + time_unit + " since " + str(start_year))
-    plt.ylabel("Minutes watched")    
+    fig, ax = new_chart(save_path)
+    ax.bar(barplot[col_to_use], barplot["Duration (min)"], color=colors[0])
+    ax.set_title("Average Netflix watch time per session by " + time_unit + " since " + str(start_year or history.min_year))
+    ax.set_ylabel("Minutes watched")    
 
-    return plt.show()
+    return finish_chart(fig, save_path)
 
-def find_max_binges(filepath, number_binges=10, start_year=None):
+@stage
+def find_max_binges(filepath, number_binges=10, start_year=None, profiles=None,
+                    save_path=None):
     """
     Reads in a clean csv file to analyze top binge lengths
 
     Input:
-        filepath (filepath): csv filepath
+        filepath (filepath or WatchHistory): cleaned data or its filepath
         number_binges (int): top binges to display
         start_year (int): start year for data analysis
+        profiles (list of str): profile name(s) to filter
+        save_path (filepath): where to save the graph instead of showing it
     
     Returns (plt bar graph): bar graph of top binges watched on Netflix
     """
-    data = pd.read_csv(filepath)
-
-    min_year = min(data["Start Year"].unique())
-    if start_year:
-        assert start_year >= min_year, print("Pick a different start year")
-        data = data[ (data["Start Year"] >= start_year) ]
-    else:
-        start_year = min_year
+    history = load_history(filepath, RANK_COLUMNS, start_year)
+    barplot = history.max_binges(number_binges, start_year, profiles)
 
-    data_to_use = data[["Title", "Binge (min)", "Start Year", "Start Month", "Start Day"]]
-    data_to_use.rename(columns={"Start Year": "year", "Start Month": "month", "Start Day": "day"}, inplace=True)
-    data_to_use["Date"] = pd.to_datetime( data_to_use[["year", "month", "day"]] )
-    data_to_use.drop(["year", "month", "day"], axis=1, inplace=True)
-    barplot = data_to_use.sort_values(by="Binge (min)", ascending=False)
-    barplot = barplot[:number_binges]
-    barplot["Date"] = barplot["Date"].astype(str)
-    barplot["Label"] = barplot[["Title", "Date"]].agg("\n".join, axis=1)
-
-    plt.bar(barplot["Label"], barplot["Binge (min)"], color=colors[0])
-    plt.title("Top " + str(number_binges) + " Netflix binges by time since " + str(start_year))
-    plt.ylabel("Minutes watched")
-    plt.xlabel("Binge date and show")
+    fig, ax = new_chart(save_path)
+    ax.bar(barplot["Label"], barplot["Binge (min)"], color=colors[0])
+    ax.set_title("Top " + str(number_binges) + " Netflix binges by time since " + str(start_year or history.min_year))
+    ax.set_ylabel("Minutes watched")
+    ax.set_xlabel("Binge date and show")
 
-    return plt.show()
+    return finish_chart(fig, save_path)
 
-def find_time_watched_by_show(filepath, number_shows=10, start_year=None):
+@stage
+def find_time_watched_by_show(filepath, number_shows=10, start_year=None,
+                              profiles=None, save_path=None):
     """
     Reads in a clean csv file to analyze total Netflix watched by show
 
     Input:
-        filepath (filepath): csv filepath
+        filepath (filepath or WatchHistory): cleaned data or its filepath
         number_shows (int): top shows to display
         start_year (int): start year for data analysis
+        profiles (list of str): profile name(s) to filter
+        save_path (filepath): where to save the graph instead of showing it
     
     Returns (plt bar graph): bar graph of top shows watched on Netflix
     """
-    data = pd.read_csv(filepath)
-
-    min_year = min(data["Start Year"].unique())
-    if start_year:
-        assert start_year >= min_year, print("Pick a different start year")
-        data = data[ (data["Start Year"] >= start_year) ]
-    else:
-        start_year = min_year
-
-    data_to_use = data[["Title", "Duration (min)"]]
-    barplot = data_to_use.groupby("Title").sum().reset_index()
-    barplot = barplot.sort_values(by="Duration (min)", ascending=False)
-    barplot = barplot[:number_shows]
+    history = load_history(filepath, RANK_COLUMNS, start_year)
+    barplot = history.time_watched_by_show(number_shows, start_year, profiles)
 
-    plt.bar(barplot["Title"], barplot["Duration (min)"], color=colors[0])
-    plt.title("Top " + str(number_shows) + " Netflix shows watched by time since " + str(start_year))
-    plt.ylabel("Minutes watched")    
+    fig, ax = new_chart(save_path)
+    ax.bar(barplot["Title"], barplot["Duration (min)"], color=colors[0])
+    ax.set_title("Top " + str(number_shows) + " Netflix shows watched by time since " + str(start_year or history.min_year))
+    ax.set_ylabel("Minutes watched")    
 
-    return plt.show()
+    return finish_chart(fig, save_path)
 
-def find_data_by_time_frame(filepath, time_unit="year", start_year=None, dur_type="show"):
+@stage
+def find_data_by_time_frame(filepath, time_unit="year", start_year=None, dur_type="show",
+                            number_shows=1, profiles=None, save_path=None):
     """
     Reads in a clean csv file to find top show or binge in a certain timeframe
 
     Input:
-        filepath (filepath): csv filepath
+        filepath (filepath or WatchHistory): cleaned data or its filepath
         time_unit (str): time_unit to slice data on
         start_year (int): start year for data analysis
         dur_type(str): what to find (show or binge)
+        number_shows (int): top shows or binges to display per time frame
+        profiles (list of str): profile name(s) to filter
+        save_path (filepath): where to save the graph instead of showing it
     
     Returns (plt bar graph): bar graph of top show or binge by timeframe spent on Netflix
     """
-    data = pd.read_csv(filepath)
-
-    assert time_unit in ["year", "month", "day of week", "day of month", "hour of day"], \
-        print("Pick a different time unit")
-    
-    assert dur_type in ["show", "binge"], print("Needs to be show or binge")
-
-    years = data["Start Year"].unique()
-    min_year = min(years)
-    if start_year:
-        assert start_year >= min_year, print("Pick a different start year")
-        data = data[ (data["Start Year"] >= start_year) ]
-    else:
-        start_year = min_year
+    assert time_unit in TIME_UNITS, print("Pick a different time unit")
 
+    history = load_history(filepath, [COLUMNS_TIME_DICT[time_unit], "Title",
+                                      "Duration (min)", "Binge (min)"], start_year)
+    barplot = history.data_by_time_frame(time_unit, start_year, dur_type, profiles,
+                                         number_shows)
+    duration_col = "Duration (min)" if dur_type == "show" else "Binge (min)"
     time_col = COLUMNS_TIME_DICT[time_unit]
-    times = data[time_col].unique()
-
-    if dur_type == "show":
-        duration_col = "Duration (min)"
-    else:
-        duration_col = "Binge (min)"    
-
-    data_to_use = data[[time_col, duration_col, "Title"]]
-    barplot = pd.DataFrame(columns=[time_col, duration_col, "Title"])
-    for time in times[::-1]:
-        df = data_to_use[ (data_to_use[time_col] == time) ]
-        if dur_type == "show":
-            df = df.groupby(["Title", time_col]).sum().reset_index()
-        maximum_duration = max(df[duration_col])
-        max_row = df[ (df[duration_col] == maximum_duration)]
-        barplot = barplot.append(max_row, ignore_index=True)
-
-    barplot = barplot.sort_values(by = time_col)
 
     if time_unit == "month":
         barplot[time_col] = barplot[time_col].map(MONTH_NAMES)
@@ -226,102 +545,87 @@ def find_data_by_time_frame(filepath, time_unit="year", start_year=None, dur_typ
 
     barplot["Label"] = barplot[[time_col, "Title"]].agg("\n".join, axis=1)
 
-    plt.bar(barplot["Label"], barplot[duration_col], color=colors[0])
-    plt.title("Top " + dur_type + " by " + time_unit + " since " + str(start_year))
-    plt.ylabel("Minutes watched")    
+    fig, ax = new_chart(save_path)
+    ax.bar(barplot["Label"], barplot[duration_col], color=colors[0])
+    ax.set_title("Top " + dur_type + " by " + time_unit + " since " + str(start_year or history.min_year))
+    ax.set_ylabel("Minutes watched")    
 
-    return plt.show()
+    return finish_chart(fig, save_path)
+
+# analyses by name, as charts and as the tables behind them, which every
+# backend's history has a method of the same name for
+ANALYSES = {"total": find_time_watched, "average": find_average_time_watched,
+            "show": find_time_watched_by_show, "binge": find_max_binges,
+            "top shows": find_data_by_time_frame}
+ANALYSIS_TABLES = {"total": "time_watched", "average": "average_time_watched",
+                   "show": "time_watched_by_show", "binge": "max_binges",
+                   "top shows": "data_by_time_frame"}
 
 if __name__ == "__main__":
-    filepath = input("What cleaned up file should we make a graph from? \n").strip()
+    parser = argparse.ArgumentParser(description="Chart Netflix watch habits from cleaned data")
+    parser.add_argument("filepath", help="cleaned csv, feather file or parquet directory")
+    parser.add_argument("analysis", choices=list(ANALYSES), type=lambda a: a.replace("-", " "),
+                        help="total or average time watched by time unit, time watched "
+                        "by show, longest binges, or top shows by time unit")
+    parser.add_argument("--time-unit", default="year", choices=TIME_UNITS,
+                        help="time unit for total, average and top shows")
+    parser.add_argument("--start-year", type=int, help="earliest year to look at")
+    parser.add_argument("--profiles", nargs="+", help="profile name(s) to look at")
+    parser.add_argument("--number", type=int, help="top shows or binges to show")
+    parser.add_argument("--dur-type", default="show", choices=["show", "binge"],
+                        help="rank top shows by time watched or by binge")
+    parser.add_argument("--rollup", help="rollup of the cleaned data to use for totals")
+    parser.add_argument("--backend", default="pandas", choices=BACKENDS,
+                        help="load the data into pandas, or query parquet data where it is "
+                        "saved with duckdb, for data bigger than memory")
+    parser.add_argument("--save", help="save the chart to this png/svg file instead of showing it")
+    parser.add_argument("--table", action="store_true",
+                        help="print the analysis instead of charting it")
+    parser.add_argument("--timings", action="store_true", help="report how long each step took")
+    parser.add_argument("--trace", help="save the time, rows and memory of each stage to this file")
+    parser.add_argument("--trace-format", default="json", choices=TRACE_FORMATS,
+                        help="json list of stages, or chrome for chrome://tracing")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="also trace peak memory, which slows things down")
+    args = parser.parse_args()
+    if args.trace:
+        start_recording(args.trace_memory)
+
+    options = {"start_year": args.start_year, "profiles": args.profiles}
+    if args.analysis in ["total", "average", "top shows"]:
+        options["time_unit"] = args.time_unit
+    if args.analysis == "top shows":
+        options["dur_type"] = args.dur_type
+    if args.number is not None:
+        if args.analysis in ["total", "average"]:
+            parser.error("--number only applies to show, binge and top shows")
+        options["number_binges" if args.analysis == "binge" else "number_shows"] = args.number
+
+    timings = {"imports": _import_seconds}
+    start = time.perf_counter()
     try:
-        f = open(filepath)
-    except:
-        print("path invalid, try a different path")
-        exit()
-
-    user_question = "\nWhat analysis should we focus on:\n"
-    user_detail_1 = "Total time watched, average time watched, watch time by show, max binges, or top show by binge / watch per unit of time (e.g. by year)?"
-    user_detail_2 = "\nPlease enter total, average, show, binge, or top shows\n"
-
-    desired_analysis = input(f"{user_question}{user_detail_1}{user_detail_2}").strip().lower()
-    while desired_analysis not in ["total", "average", "show", "binge", "top shows"]:
-        print("cannot run this analysis, please select again")
-        desired_analysis = input(f"{user_question}{user_detail_1}{user_detail_2}").strip().lower()
-
-    data = pd.read_csv(filepath)
-    min_year = min(data["Start Year"].unique())
-
-    time_unit_prompt = "please select a time unit from the following:"
-    time_options = ["year", "month", "day of week", "day of month", "hour of day"]
-
-    show_prompt = "Please select the number of top-watched shows you want shown (less than or equal to "
-    binge_prompt = "Please select the number of longest binges you want shown (less than or equal to "
-
-    top_show_prompt = "Pick between most watched show or longest binge.\nPlease pick between: "
-    top_show_options = ["show", "binge"]
-
-    start_year_prompt = "please select a start year for analysis greater than or equal to "
-
-    start_year = input(f"{start_year_prompt}{min_year}\n")
-    while not start_year.isdigit():
-        print("Please enter an integer \n")
-        start_year = input(f"{start_year_prompt}{min_year}\n")
-    start_year = int(start_year)
-    while start_year < min_year:
-        print("Invalid year \n")
-        start_year = input(f"{start_year_prompt}{min_year}\n")
-        while not start_year.isdigit():
-            print("Please enter an integer \n")
-            start_year = input(f"{start_year_prompt}{min_year}\n")
-        start_year = int(start_year)
-
-    if desired_analysis in ["total", "average"]:
-        time_input = input(f"{time_unit_prompt}\n{time_options}\n")
-        while time_input not in time_options:
-            print("Invalid selection \n")
-            time_input = input(f"{time_unit_prompt}\n{time_options}\n")
-        if desired_analysis == "total":
-            find_time_watched(filepath, time_input, start_year)
-        else:
-            find_average_time_watched(filepath, time_input, start_year)
-    elif desired_analysis == "binge":
-        max_binges = len(data["Binge (min)"].unique())
-        number_binges = input(f"{binge_prompt}{max_binges})\n")
-        while not number_binges.isdigit():
-            print("Please enter an integer greater than 0 \n")
-            number_binges = input(f"{binge_prompt}{max_binges})\n")
-        number_binges = int(number_binges)
-        while number_binges > max_binges or number_binges < 1:
-            print("Invalid number of shows \n")
-            number_binges = input(f"{show_prompt}{max_binges})\n")
-            while not number_binges.isdigit():
-                print("Please enter an integer \n")
-                number_binges = input(f"{show_prompt}{max_binges})\n")
-            number_binges = int(number_binges)
-        find_max_binges(filepath, number_binges, start_year)
-    elif desired_analysis == "top shows":
-        time_input = input(f"{time_unit_prompt}\n{time_options}\n")
-        while time_input not in time_options:
-            print("Invalid selection \n")
-            time_input = input(f"{time_unit_prompt}\n{time_options}\n")
-        dur_type = input(f"{top_show_prompt}\n{top_show_options}\n")
-        while dur_type not in top_show_options:
-            print("Invalid selection \n")
-            dur_type = input(f"{top_show_prompt}\n{top_show_options}\n")
-        find_data_by_time_frame(filepath, time_input, start_year, dur_type)
+        history = open_history(args.filepath, args.backend, args.rollup)
+    except ImportError:
+        parser.error("the duckdb backend needs duckdb installed (pip install duckdb)")
+    timings["loading data"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if args.table:
+        print(getattr(history, ANALYSIS_TABLES[args.analysis])(**options).to_string(index=False))
     else:
-        max_shows = len(data["Title"].unique())
-        number_shows = input(f"{show_prompt}{max_shows})\n")
-        while not number_shows.isdigit():
-            print("Please enter an integer greater than 0 \n")
-            number_shows = input(f"{show_prompt}{max_shows})\n")
-        number_shows = int(number_shows)
-        while number_shows > max_shows or number_shows < 1:
-            print("Invalid number of shows \n")
-            number_shows = input(f"{show_prompt}{max_shows})\n")
-            while not number_shows.isdigit():
-                print("Please enter an integer \n")
-                number_shows = input(f"{show_prompt}{max_shows})\n")
-            number_shows = int(number_shows)
-        find_time_watched_by_show(filepath, number_shows, start_year)
\ No newline at end of file
+        if args.save:
+            import matplotlib
+            matplotlib.use("Agg") # nothing to show, so no display needed
+        load_plotting()
+        timings["plotting imports"] = time.perf_counter() - start
+        start = time.perf_counter()
+        ANALYSES[args.analysis](history, save_path=args.save, **options)
+    timings["analysis"] = time.perf_counter() - start
+
+    if args.timings:
+        timings["total"] = time.perf_counter() - _import_start
+        print(", ".join(f"{step} {seconds:.2f}s" for step, seconds in timings.items()))
+    if args.trace:
+        records = stop_recording()
+        write_trace(records, args.trace, args.trace_format)
+        print(summarize(records))
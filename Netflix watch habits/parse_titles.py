@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import re
+import pandas as pd
+from time_stages import stage
+
+TITLE_FIELDS = ["Subtitle", "Season", "Episode"]
+
+# Rules are tried in order against the colon separated parts of a title
+# (part 0 is the show name) and the first match decides the layout.
+#
+# Match keys:
+#     length / min_length: number of parts
+#     title / title_contains: the show name, exactly or as a substring
+#     part / part_contains: part 1, exactly or as a substring (a list of
+#         substrings matches if any of them is found)
+# Field keys (Subtitle, Season, Episode) hold the part(s) to use, either a
+# single index ("1") or a slice ("1:3", "2:") joined back with ": ". Fields
+# left out of a rule are blank, as are titles that match no rule.
+TITLE_RULES = [
+    {"length": 2, "Subtitle": "1"},
+    # special cases
+    {"min_length": 3, "part_contains": "Book", "title_contains": "Avatar",
+     "Season": "1", "Episode": "2"},
+    {"min_length": 3, "part_contains": "Book", "Season": "1:3", "Episode": "3"},
+    {"min_length": 3, "title_contains": "Bleach", "Season": "1", "Episode": "2"},
+    {"min_length": 3, "title": "Comedians in Cars Getting Coffee",
+     "part": "New 2018", "Season": "1:3", "Episode": "3:"}, # special season
+    {"min_length": 3, "title": "Comedians in Cars Getting Coffee",
+     "Season": "1", "Episode": "2:"},
+    {"min_length": 3, "part": "Black & White",
+     "Subtitle": "1", "Season": "2", "Episode": "4"},
+    # general rules
+    {"min_length": 3, "part_contains": ["Season", "Part", "Volume"],
+     "Season": "1", "Episode": "2"},
+    {"length": 3, "Subtitle": "1", "Episode": "2"},
+    {"length": 4, "Subtitle": "1", "Season": "2", "Episode": "3"},
+]
+
+def load_title_rules(rules_path=None):
+    """
+    Builds the title rule table, adding any rules from a json config file
+
+    Input:
+        rules_path (filepath): json file holding a list of extra rules,
+            which are tried before the built in ones
+
+    Returns (list of dict): title rules
+    """
+    if not rules_path:
+        return TITLE_RULES
+    with open(rules_path) as f:
+        return json.load(f) + TITLE_RULES
+
+def compile_rules(rules):
+    """
+    Turns a rule table into ready to apply rules, each the range of part
+    counts it takes, a match function for its other checks (None if it has
+    none) and its field slices
+
+    Input:
+        rules (list of dict): title rules
+
+    Returns (list of tuple): fewest and most parts, match function and
+        field slices for each rule
+    """
+    compiled = []
+    for rule in rules:
+        fewest = rule.get("length", rule.get("min_length", 0))
+        most = rule.get("length", float("inf"))
+        compiled.append((fewest, most, _matcher(rule),
+                         [_to_slice(rule.get(field)) for field in TITLE_FIELDS]))
+    return compiled
+
+def _matcher(rule):
+    # part counts are checked by parse_title itself, which runs for every
+    # distinct title, so only rules with other checks get a function
+    title, part = rule.get("title"), rule.get("part")
+    title_contains = _substrings(rule.get("title_contains"))
+    part_contains = _substrings(rule.get("part_contains"))
+    if title is None and part is None and title_contains is None and part_contains is None:
+        return None
+    def matches(row):
+        if title is not None and row[0] != title:
+            return False
+        if title_contains is not None and not title_contains.search(row[0]):
+            return False
+        if part is not None and (len(row) < 2 or row[1] != part):
+            return False
+        if part_contains is not None and \
+                (len(row) < 2 or not part_contains.search(row[1])):
+            return False
+        return True
+    return matches
+
+def _substrings(substrings):
+    # a pattern finding any of the substrings, as one search is quicker
+    # than looking for each
+    if substrings is None:
+        return None
+    if isinstance(substrings, str):
+        substrings = [substrings]
+    # nothing to find never matches, like any() of no substrings
+    return re.compile("|".join(map(re.escape, substrings)) or "(?!)")
+
+def _to_slice(spec):
+    if spec is None:
+        return None
+    if ":" not in spec:
+        return slice(int(spec), int(spec) + 1)
+    start, stop = spec.split(":")
+    return slice(int(start) if start else None, int(stop) if stop else None)
+
+def parse_title(title, compiled_rules):
+    """
+    Splits a Netflix title into its show name, subtitle, season and episode
+
+    Input:
+        title (str): title as given in the Netflix export
+        compiled_rules (list of tuple): output of compile_rules
+
+    Returns (list of str): title, subtitle, season and episode
+    """
+    row = [col.strip() for col in title.split(":")]
+    if "Part " in row[-1] and len(row) > 3: # for episodes such as Manchester: Part I
+        row = row[:-2] + [row[-2] + ": " + row[-1]]
+    parts = len(row)
+    for fewest, most, matches, layout in compiled_rules:
+        if fewest <= parts <= most and (matches is None or matches(row)):
+            return [row[0]] + ["" if part is None else ": ".join(row[part])
+                               for part in layout]
+    # movie or some other thing of 1 item length
+    return [row[0], "", "", ""]
+
+@stage
+def split_titles(titles, rules=None, cache_path=None):
+    """
+    Splits a column of titles, parsing each distinct title only once
+
+    Input:
+        titles (pd.series): titles as given in the Netflix export
+        rules (list of dict): title rules, defaults to TITLE_RULES
+        cache_path (filepath): json file of already parsed titles, reused
+            and updated between runs
+
+    Returns (pd.dataframe): Title, Subtitle, Season and Episode columns,
+        missing for missing titles
+    """
+    rules = TITLE_RULES if rules is None else rules
+    rules_key = hashlib.md5(json.dumps(rules, sort_keys=True).encode()).hexdigest()
+
+    cache = {}
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path) as f:
+            saved = json.load(f)
+        # parses made under a different rule table are stale
+        if saved.get("rules") == rules_key:
+            cache = saved["titles"]
+
+    codes, uniques = pd.factorize(titles)
+    new_titles = [title for title in uniques.tolist() if title not in cache]
+    if new_titles:
+        compiled_rules = compile_rules(rules)
+        for title in new_titles:
+            cache[title] = parse_title(title, compiled_rules)
+        if cache_path:
+            with open(cache_path, "w") as f:
+                json.dump({"rules": rules_key, "titles": cache}, f)
+
+    parsed = pd.DataFrame([cache[title] for title in uniques.tolist()],
+                          columns=["Title"] + TITLE_FIELDS)
+    # missing titles have code -1, which reindex leaves missing in every column
+    split = parsed.reindex(codes)
+    split.index = titles.index
+    return split
@@ -0,0 +1,121 @@
+from collections import OrderedDict
+import numpy as np
+from time_stages import record_rows_in, stage
+
+# binges and show totals are ranked within each of these
+RANK_GROUPS = ["Profile Name", "Start Year"]
+RANK_COLUMNS = RANK_GROUPS + ["Title", "Start Month", "Start Day", "Binge (min)",
+                              "Duration (min)"]
+SHOWS_KEPT = 16 # show totals to keep cached, least recently used dropped first
+
+class RankIndex:
+    """
+    Cleaned data ranked once so that the longest binges and most watched
+    shows can be found for any start year and profiles without sorting every
+    row again. Binges are kept sorted within each profile and year, so a top
+    N query only looks at the first N binges of each; show totals are kept
+    per profile, year and title. Minutes are ranked and totalled in the
+    units data keeps them in, e.g. whole hundredths for compact data
+    """
+    @stage
+    def __init__(self, data):
+        """
+        Input:
+            data (pd.dataframe): cleaned data, with at least RANK_COLUMNS
+        """
+        binges = data[RANK_GROUPS + ["Title", "Binge (min)", "Start Month", "Start Day"]]
+        binges = binges.assign(Row = np.arange(len(binges)))
+        binges = binges.sort_values(by=RANK_GROUPS + ["Binge (min)"],
+                                    ascending=[True, True, False], kind="stable")
+        self._binges = binges
+        self._binge_values = binges["Binge (min)"].to_numpy()
+        self._binge_rows = binges["Row"].to_numpy()
+        # first and last position of each profile and year's binges
+        groups = binges.groupby(RANK_GROUPS, observed=True, sort=False).size()
+        ends = groups.cumsum().to_numpy()
+        self._binge_groups = dict(zip(groups.index, zip(ends - groups.to_numpy(), ends)))
+
+        self._show_totals = data.groupby(RANK_GROUPS + ["Title"], observed=True)[
+            "Duration (min)"].sum()
+        self._shows = OrderedDict()
+
+    def top_binges(self, number_binges=10, start_year=None, profiles=None, offset=0):
+        """
+        Finds the longest binges, a page at a time
+
+        Input:
+            number_binges (int): binges to find
+            start_year (int): start year for data analysis
+            profiles (list of str): profile name(s) to filter
+            offset (int): longest binges to skip, for later pages
+
+        Returns (pd.dataframe): title, length, month and day of the binges,
+            longest first, ties in the order they were loaded
+        """
+        needed = offset + number_binges
+        # the top binges overall are among the top binges of each group
+        positions = [np.arange(start, min(end, start + needed))
+                     for (profile, year), (start, end) in self._binge_groups.items()
+                     if (not start_year or year >= start_year) and
+                     (not profiles or profile in profiles)]
+        if not positions:
+            return self._binges.iloc[:0]
+        positions = np.concatenate(positions)
+        record_rows_in(len(positions))
+        order = np.lexsort((self._binge_rows[positions], -self._binge_values[positions]))
+        return self._binges.iloc[positions[order][offset:needed]]
+
+    def show_totals(self, start_year=None, profiles=None):
+        """
+        Totals time watched by show, reusing the result of the last
+        SHOWS_KEPT calls
+
+        Input:
+            start_year (int): start year for data analysis
+            profiles (list of str): profile name(s) to filter
+
+        Returns (pd.series): minutes watched of every show, by title
+        """
+        key = (start_year, tuple(sorted(profiles)) if profiles else None)
+        if key not in self._shows:
+            totals = self._show_totals
+            if start_year:
+                totals = totals[ (totals.index.get_level_values("Start Year") >= start_year) ]
+            if profiles:
+                totals = totals[ (totals.index.get_level_values("Profile Name").isin(profiles)) ]
+            self._shows[key] = totals.groupby(level="Title", observed=True).sum()
+            if len(self._shows) > SHOWS_KEPT:
+                self._shows.popitem(last=False)
+        self._shows.move_to_end(key)
+        return self._shows[key]
+
+    def clear_show_totals(self):
+        """
+        Forgets the show totals cached by show_totals
+        """
+        self._shows = OrderedDict()
+
+    def top_shows(self, number_shows=10, start_year=None, profiles=None, offset=0):
+        """
+        Finds the shows watched the longest, a page at a time
+
+        Input:
+            number_shows (int): shows to find
+            start_year (int): start year for data analysis
+            profiles (list of str): profile name(s) to filter
+            offset (int): top shows to skip, for later pages
+
+        Returns (pd.dataframe): minutes watched of the shows, most first,
+            ties in title order
+        """
+        totals = self.show_totals(start_year, profiles)
+        record_rows_in(len(totals))
+        needed = min(offset + number_shows, len(totals))
+        if needed <= offset:
+            return totals.iloc[:0].reset_index()
+        values = totals.to_numpy()
+        # only the shows at least as long as the needed-th longest get sorted
+        cutoff = -np.partition(-values, needed - 1)[needed - 1]
+        candidates = np.flatnonzero(values >= cutoff)
+        order = candidates[np.lexsort((candidates, -values[candidates]))]
+        return totals.iloc[order[offset:needed]].reset_index()
@@ -0,0 +1,149 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from make_graphs import ANALYSES, WatchHistory
+from store_data import read_cleaned
+
+IMAGE_FORMATS = [".png", ".svg"]
+DEFAULT_CHARTS = [{"analysis": "total", "time_unit": "year"},
+                  {"analysis": "average", "time_unit": "hour of day"},
+                  {"analysis": "show", "number_shows": 10},
+                  {"analysis": "binge", "number_binges": 10},
+                  {"analysis": "top shows", "time_unit": "year", "dur_type": "show"}]
+
+def plan_charts(charts, profiles=None):
+    """
+    Makes a copy of each chart for every profile, so that each profile gets
+    its own report
+
+    Input:
+        charts (list of dict): charts to render, each an analysis from
+            ANALYSES along with the options of its find_ function
+        profiles (list of str): profiles to make reports for, or None for
+            one report of everyone
+
+    Returns (list of dict): charts to render, grouped by profile
+    """
+    if not profiles:
+        return [dict(chart) for chart in charts]
+    return [dict(chart, profiles=[profile]) for profile in profiles for chart in charts]
+
+def chart_name(chart):
+    """
+    Names a chart's file after its profile(s), analysis and options
+
+    Input:
+        chart (dict): chart to render
+
+    Returns (str): file name without extension, e.g. Matthew_top_shows_year
+    """
+    profiles = "+".join(chart.get("profiles") or ["all"])
+    options = [str(value) for key, value in chart.items()
+               if key not in ["analysis", "profiles"]]
+    name = "_".join([profiles, chart["analysis"]] + options)
+    return name.replace(" ", "_").replace(os.sep, "-")
+
+# each worker process loads the watch data once and keeps it here
+_history = None
+
+def _load_history(filepath, rollup_path):
+    global _history
+    import matplotlib
+    matplotlib.use("Agg") # render to files, no display needed
+    _history = WatchHistory(filepath, rollup_path=rollup_path)
+
+def _render_charts(charts, output_dir, image_format):
+    rendered, errors = [], {}
+    for chart in charts:
+        options = dict(chart)
+        analysis = options.pop("analysis")
+        save_path = os.path.join(output_dir, chart_name(chart) + image_format)
+        try:
+            rendered.append(ANALYSES[analysis](_history, save_path=save_path, **options))
+        except Exception as error:
+            errors[chart_name(chart)] = repr(error)
+    # a batch is one profile's charts, which later batches won't reuse
+    _history.clear_views()
+    return rendered, errors
+
+def render_charts(filepath, charts, output_dir, image_format=".png", workers=1,
+                  rollup_path=None):
+    """
+    Renders many charts from cleaned data into image files in one run,
+    loading the data once per worker process. A chart that fails to render
+    is reported and skipped without stopping the others
+
+    Input:
+        filepath (filepath): cleaned csv, feather file or parquet directory
+        charts (list of dict): charts to render, see plan_charts
+        output_dir (filepath): directory to save the charts in
+        image_format (str): .png or .svg
+        workers (int): processes to render with
+        rollup_path (filepath): rollup of the cleaned data to load
+
+    Returns (dict): error message for each chart that failed
+    """
+    assert image_format in IMAGE_FORMATS, print("Pick .png or .svg")
+    for chart in charts:
+        assert chart.get("analysis") in ANALYSES, print(f"Pick one of {list(ANALYSES)}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    # charts of the same profiles go to the same worker, to share their views
+    batches = {}
+    for chart in charts:
+        batches.setdefault(tuple(chart.get("profiles") or []), []).append(chart)
+
+    errors = {}
+    rendered = 0
+    start = time.perf_counter()
+    if workers == 1:
+        _load_history(filepath, rollup_path)
+        for batch in batches.values():
+            paths, batch_errors = _render_charts(batch, output_dir, image_format)
+            rendered += len(paths)
+            errors.update(batch_errors)
+    else:
+        with ProcessPoolExecutor(workers, initializer=_load_history,
+                                 initargs=(filepath, rollup_path)) as pool:
+            futures = [pool.submit(_render_charts, batch, output_dir, image_format)
+                       for batch in batches.values()]
+            for done, future in enumerate(as_completed(futures), 1):
+                paths, batch_errors = future.result()
+                rendered += len(paths)
+                errors.update(batch_errors)
+                print(f"[{done}/{len(futures)}] {rendered} charts rendered")
+
+    seconds = time.perf_counter() - start
+    print(f"Rendered {rendered} of {len(charts)} charts in {seconds:.1f}s "
+          f"({rendered / seconds:.1f} charts per second)")
+    return errors
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render Netflix charts to image files")
+    parser.add_argument("filepath", help="cleaned csv, feather file or parquet directory")
+    parser.add_argument("output_dir", help="directory to save charts in")
+    parser.add_argument("--charts", help="json file listing the charts to render, e.g. "
+                        '[{"analysis": "total", "time_unit": "month", "start_year": 2020}]')
+    parser.add_argument("--per-profile", action="store_true",
+                        help="render the charts once for each profile")
+    parser.add_argument("--format", default=".png", choices=IMAGE_FORMATS,
+                        help="image format to save charts as")
+    parser.add_argument("--workers", type=int, default=1, help="processes to use")
+    parser.add_argument("--rollup", help="rollup of the cleaned data to load")
+    args = parser.parse_args()
+
+    charts = DEFAULT_CHARTS
+    if args.charts:
+        with open(args.charts) as f:
+            charts = json.load(f)
+    profiles = None
+    if args.per_profile:
+        profiles = list(read_cleaned(args.filepath, ["Profile Name"])["Profile Name"].unique())
+
+    errors = render_charts(args.filepath, plan_charts(charts, profiles), args.output_dir,
+                           args.format, args.workers, args.rollup)
+    for name, error in errors.items():
+        print(f"{name}: {error}")
+    exit(1 if errors else 0)
@@ -0,0 +1,48 @@
+import pandas as pd
+from time_stages import stage
+
+# cleaned rows are summed up over every combination of these columns
+ROLLUP_DIMENSIONS = ["Profile Name", "Title", "Start Year", "Start Month",
+                     "Start Day of Week", "Start Hour"]
+ROLLUP_SUMS = ["Duration Sum (min)", "Views", "Binge Sum (min)", "Binges"]
+ROLLUP_MAXES = ["Duration Max (min)", "Binge Max (min)"]
+
+@stage
+def build_rollup(data):
+    """
+    Sums up cleaned data by profile, title, year, month, day of week and hour
+
+    Input:
+        data (pd.dataframe): cleaned data
+
+    Returns (pd.dataframe): one row per combination watched, with the total,
+        count and longest of its views and binges
+    """
+    data = data.assign(Binges = data["Binge (min)"] > 0)
+    rollup = data.groupby(ROLLUP_DIMENSIONS, observed=True).agg(**{
+        "Duration Sum (min)": ("Duration (min)", "sum"),
+        "Views": ("Duration (min)", "size"),
+        "Binge Sum (min)": ("Binge (min)", "sum"),
+        "Binges": ("Binges", "sum"),
+        "Duration Max (min)": ("Duration (min)", "max"),
+        "Binge Max (min)": ("Binge (min)", "max"),
+    })
+    return rollup.reset_index()
+
+@stage
+def update_rollup(rollup, data):
+    """
+    Adds newly cleaned rows to an existing rollup without rebuilding it
+
+    Input:
+        rollup (pd.dataframe): output of build_rollup, or None to start one
+        data (pd.dataframe): cleaned rows not yet in the rollup
+
+    Returns (pd.dataframe): updated rollup
+    """
+    if rollup is None:
+        return build_rollup(data)
+    combined = pd.concat([rollup, build_rollup(data)], ignore_index=True)
+    totals = {col: "sum" for col in ROLLUP_SUMS}
+    totals.update({col: "max" for col in ROLLUP_MAXES})
+    return combined.groupby(ROLLUP_DIMENSIONS, observed=True).agg(totals).reset_index()
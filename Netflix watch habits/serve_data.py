@@ -0,0 +1,345 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+from make_graphs import ANALYSIS_TABLES, TIME_UNITS, WatchHistory
+from store_data import store_version
+
+CACHE_SIZE = 1024 # query results to keep
+# analysis behind each endpoint, and the query parameters it takes
+ENDPOINTS = {"/totals": ("total", ["time_unit"]),
+             "/averages": ("average", ["time_unit"]),
+             "/top-shows": ("show", ["number", "offset"]),
+             "/top-binges": ("binge", ["number", "offset"]),
+             "/top-by-time-frame": ("top shows", ["time_unit", "dur_type", "number"])}
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               500: "Internal Server Error"}
+
+class QueryError(Exception):
+    """
+    A query that can't be answered, reported to the client with its status
+    """
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class QueryService:
+    """
+    Cleaned watch data loaded once and queried over HTTP, with query results
+    kept in an LRU cache keyed by the query and the version of the data.
+    Analyses run one at a time on a worker thread so the server keeps
+    answering cached queries while one is worked out
+    """
+    def __init__(self, filepath, rollup_path=None, cache_size=CACHE_SIZE):
+        """
+        Input:
+            filepath (filepath): cleaned csv, feather file or parquet directory
+            rollup_path (filepath): rollup of the cleaned data to load
+            cache_size (int): query results to keep, 0 to keep none
+        """
+        self.filepath, self.rollup_path = filepath, rollup_path
+        self.cache_size = cache_size
+        self.version = store_version(filepath)
+        self.history = WatchHistory(filepath, rollup_path=rollup_path)
+        self.cache = OrderedDict()
+        self.hits, self.misses = 0, 0
+        self._running = {}
+        self._worker = ThreadPoolExecutor(1)
+
+    def parse_query(self, target):
+        """
+        Works out the analysis and its options from a request target, e.g.
+        /totals?time_unit=month&profile=Matthew&start_year=2020
+
+        Input:
+            target (str): path and query string of the request
+
+        Returns (tuple): endpoint path and sorted tuple of (option, value)
+        """
+        url = urlsplit(target)
+        if url.path not in ENDPOINTS:
+            raise QueryError(404, f"Pick one of {list(ENDPOINTS)}")
+        analysis, allowed = ENDPOINTS[url.path]
+        params = parse_qs(url.query)
+        unknown = set(params) - set(allowed) - {"profile", "start_year"}
+        if unknown:
+            raise QueryError(400, f"Unknown parameters {sorted(unknown)}")
+
+        options = {}
+        if "profile" in params:
+            options["profiles"] = tuple(sorted(params["profile"]))
+        for name in ["start_year", "number", "offset"]:
+            if name in params:
+                value = params[name][-1]
+                if not value.isdigit():
+                    raise QueryError(400, f"{name} must be a whole number")
+                options[name] = int(value)
+        if "time_unit" in params:
+            options["time_unit"] = params["time_unit"][-1]
+            if options["time_unit"] not in TIME_UNITS:
+                raise QueryError(400, f"time_unit must be one of {TIME_UNITS}")
+        if "dur_type" in params:
+            options["dur_type"] = params["dur_type"][-1]
+            if options["dur_type"] not in ["show", "binge"]:
+                raise QueryError(400, "dur_type must be show or binge")
+        if self.history.min_year is not None and \
+                options.get("start_year", self.history.min_year) < self.history.min_year:
+            raise QueryError(400, f"start_year must be at least {self.history.min_year}")
+        return url.path, tuple(sorted(options.items()))
+
+    def run_query(self, path, options):
+        """
+        Runs an analysis and encodes its result as JSON
+
+        Input:
+            path (str): endpoint path
+            options (tuple): output of parse_query
+
+        Returns (bytes): JSON body of the response
+        """
+        analysis = ENDPOINTS[path][0]
+        options = dict(options)
+        if "number" in options:
+            options["number_binges" if analysis == "binge" else "number_shows"] = \
+                options.pop("number")
+        if "profiles" in options:
+            options["profiles"] = list(options["profiles"])
+        result = getattr(self.history, ANALYSIS_TABLES[analysis])(**options)
+        return json.dumps({"version": self.version,
+                           "rows": json.loads(result.to_json(orient="records"))}).encode()
+
+    async def answer(self, target):
+        """
+        Answers a request from the cache, or runs its query on the worker
+        thread. Identical queries arriving together share one run
+
+        Input:
+            target (str): path and query string of the request
+
+        Returns (bytes): JSON body of the response
+        """
+        if urlsplit(target).path == "/version":
+            return json.dumps({"version": self.version, "cached": len(self.cache),
+                               "hits": self.hits, "misses": self.misses}).encode()
+        path, options = self.parse_query(target)
+        key = (self.version, path, options)
+        if key in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        self.misses += 1
+        if key not in self._running:
+            loop = asyncio.get_running_loop()
+            self._running[key] = loop.run_in_executor(self._worker, self.run_query,
+                                                      path, options)
+        try:
+            body = await self._running[key]
+        finally:
+            self._running.pop(key, None)
+        if self.cache_size:
+            self.cache[key] = body
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return body
+
+    async def reload_when_changed(self, seconds):
+        """
+        Checks the cleaned data every few seconds, loading it again when it
+        changes. Results cached for the old version are no longer used. Data
+        is only loaded once it is the same on two checks in a row, so a store
+        still being written isn't loaded half done, and a check or load that
+        fails is reported and the data already loaded kept
+
+        Input:
+            seconds (float): time between checks
+        """
+        loop = asyncio.get_running_loop()
+        last_seen = self.version
+        while True:
+            await asyncio.sleep(seconds)
+            try:
+                version = store_version(self.filepath)
+                if version != self.version and version == last_seen:
+                    history = await loop.run_in_executor(
+                        self._worker, WatchHistory, self.filepath, None, None,
+                        self.rollup_path)
+                    # changed while it was loading, so load it once it settles
+                    if store_version(self.filepath) == version:
+                        self.history, self.version = history, version
+                        self.cache.clear()
+                        print(f"Reloaded {self.filepath} (version {version})")
+                last_seen = version
+            except Exception as error:
+                last_seen = None
+                print(f"Couldn't reload {self.filepath}, still serving version "
+                      f"{self.version}: {error!r}")
+
+    async def handle(self, reader, writer):
+        """
+        Serves HTTP/1.1 GET requests on one connection, keeping it open
+        between requests unless the client asks to close it
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in [b"\r\n", b"\n", b""]:
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip().lower()
+                method, target, _ = (request_line.decode("latin-1").split() + ["", ""])[:3]
+
+                status = 200
+                if method != "GET":
+                    status, body = 405, json.dumps({"error": "Only GET is supported"}).encode()
+                else:
+                    try:
+                        body = await self.answer(target)
+                    except QueryError as error:
+                        status, body = error.status, json.dumps({"error": str(error)}).encode()
+                    except (AssertionError, KeyError, ValueError) as error:
+                        status, body = 400, json.dumps({"error": repr(error)}).encode()
+                    except Exception as error:
+                        status, body = 500, json.dumps({"error": repr(error)}).encode()
+
+                close = headers.get("connection") == "close"
+                writer.write(f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                             f"Content-Type: application/json\r\n"
+                             f"Content-Length: {len(body)}\r\n"
+                             f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n"
+                             .encode() + body)
+                await writer.drain()
+                if close:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+async def serve(service, host="127.0.0.1", port=8000, reload_seconds=None):
+    """
+    Runs the HTTP server until stopped
+
+    Input:
+        service (QueryService): loaded watch data to query
+        host (str): address to listen on
+        port (int): port to listen on
+        reload_seconds (float): how often to check for changed data, if at all
+    """
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"Serving {service.filepath} on http://{host}:{port}")
+    if reload_seconds:
+        asyncio.get_running_loop().create_task(service.reload_when_changed(reload_seconds))
+    async with server:
+        await server.serve_forever()
+
+def plan_load_test(history, number_queries=50, seed=0):
+    """
+    Makes a mix of dashboard queries across every endpoint
+
+    Input:
+        history (WatchHistory): loaded watch data, for its profiles and years
+        number_queries (int): distinct queries to make
+        seed (int): random seed, so the mix is the same each run
+
+    Returns (list of str): request targets
+    """
+    rng = random.Random(seed)
+    profiles = sorted(history.data["Profile Name"].astype(str).unique()) if \
+        history.data is not None else []
+    years = list(range(history.min_year, history.min_year + 5))
+    targets = set()
+    while len(targets) < number_queries:
+        path, (analysis, allowed) = rng.choice(list(ENDPOINTS.items()))
+        params = [f"start_year={rng.choice(years)}"]
+        if profiles and rng.random() < 0.7:
+            params.append(f"profile={rng.choice(profiles)}")
+        if "time_unit" in allowed:
+            params.append(f"time_unit={rng.choice(TIME_UNITS).replace(' ', '+')}")
+        if "number" in allowed:
+            params.append(f"number={rng.choice([5, 10, 20])}")
+        targets.add(path + "?" + "&".join(params))
+    return sorted(targets)
+
+async def load_test(service, targets, number_requests=2000, concurrency=20, seed=0):
+    """
+    Serves the watch data on a free local port and sends it many requests
+    from concurrent keep-alive clients, timing each one
+
+    Input:
+        service (QueryService): loaded watch data to query
+        targets (list of str): request targets to pick from
+        number_requests (int): requests to send in total
+        concurrency (int): clients sending requests at once
+        seed (int): random seed for the order of requests
+
+    Returns (dict): requests per second, latency percentiles and cache hits
+    """
+    server = await asyncio.start_server(service.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    rng = random.Random(seed)
+    queue = [rng.choice(targets) for _ in range(number_requests)]
+    latencies, failures = [], 0
+
+    async def client():
+        nonlocal failures
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        while queue:
+            target = queue.pop()
+            start = time.perf_counter()
+            writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+            await writer.drain()
+            status = (await reader.readline()).split()[1]
+            length = 0
+            while (line := await reader.readline()) not in [b"\r\n", b""]:
+                if line.lower().startswith(b"content-length"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            failures += status != b"200"
+        writer.close()
+
+    start = time.perf_counter()
+    async with server:
+        await asyncio.gather(*[client() for _ in range(concurrency)])
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    return {"requests": number_requests, "failures": failures,
+            "requests per second": number_requests / seconds,
+            "p50 ms": latencies[len(latencies) // 2] * 1000,
+            "p99 ms": latencies[int(len(latencies) * 0.99)] * 1000,
+            "cache hits": service.hits, "cache misses": service.misses}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve Netflix watch analyses as JSON over HTTP")
+    parser.add_argument("filepath", help="cleaned csv, feather file or parquet directory")
+    parser.add_argument("--rollup", help="rollup of the cleaned data to load")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8000, help="port to listen on")
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE,
+                        help="query results to keep (0 for none)")
+    parser.add_argument("--reload-seconds", type=float,
+                        help="check for changed data this often and reload it")
+    parser.add_argument("--load-test", type=int, metavar="REQUESTS",
+                        help="instead of serving, time this many requests from local clients")
+    parser.add_argument("--concurrency", type=int, default=20,
+                        help="clients sending requests at once in the load test")
+    args = parser.parse_args()
+
+    service = QueryService(args.filepath, args.rollup, args.cache_size)
+    if args.load_test:
+        targets = plan_load_test(service.history)
+        results = asyncio.run(load_test(service, targets, args.load_test, args.concurrency))
+        print(", ".join(f"{name} {value:.1f}" if isinstance(value, float) else f"{name} {value}"
+                        for name, value in results.items()))
+    else:
+        asyncio.run(serve(service, args.host, args.port, args.reload_seconds))
@@ -0,0 +1,193 @@
+import os
+import duckdb
+import pandas as pd
+from make_graphs import (COLUMNS_TIME_DICT, TIME_UNITS, label_binges, name_time_units,
+                         rank_top)
+from store_data import MINUTE_SCALE, get_format
+from time_stages import record_rows_in, stage
+
+# minutes are summed as whole hundredths, as WatchHistory keeps them (see
+# store_data.compact_cleaned), so both backends give the same totals
+DURATION = f'CAST(round("Duration (min)" * {MINUTE_SCALE}) AS BIGINT)'
+BINGE = f'CAST(round("Binge (min)" * {MINUTE_SCALE}) AS BIGINT)'
+# views are numbered in the order pandas loads them, to break ties the same way
+LOAD_ORDER = "filename, file_row_number"
+
+class SQLHistory:
+    """
+    Cleaned watch data queried where it is saved with DuckDB, instead of
+    being loaded into memory like WatchHistory, with the same analyses and
+    the same results. Each query reads only the columns it uses and the
+    profile and year partitions it filters on, aggregates on every core
+    and spills to disk past the memory limit, so histories bigger than
+    memory can be analysed
+    """
+    def __init__(self, filepath, memory_limit=None, threads=None):
+        """
+        Input:
+            filepath (filepath): cleaned parquet directory
+            memory_limit (str): most memory DuckDB may use, e.g. "2GB",
+                defaults to most of it
+            threads (int): threads to query with, defaults to one per core
+        """
+        assert get_format(filepath) == ".parquet", print("The SQL backend reads cleaned data saved as parquet")
+        assert os.path.isdir(filepath), print("path invalid, try a different path")
+        config = {"memory_limit": memory_limit, "threads": threads}
+        self.connection = duckdb.connect(config={key: value for key, value in config.items()
+                                                 if value is not None})
+        files = os.path.join(filepath, "**", "*.parquet").replace("'", "''")
+        self.connection.execute(f"""
+            CREATE VIEW views AS SELECT * FROM read_parquet('{files}',
+                hive_partitioning = true, filename = true, file_row_number = true,
+                hive_types = {{'Profile Name': 'VARCHAR', 'Start Year': 'SMALLINT'}})""")
+        min_year = self._query('SELECT min("Start Year") AS "Start Year" FROM views') \
+            ["Start Year"].iloc[0]
+        # None when there are no views, as in WatchHistory
+        self.min_year = None if pd.isna(min_year) else int(min_year)
+
+    def _query(self, sql, params=None):
+        return self.connection.execute(sql, params or []).df()
+
+    def _where(self, start_year, profiles):
+        # filtering on the partition columns skips the files of other years
+        # and profiles altogether
+        conditions, params = [], []
+        if start_year:
+            assert self.min_year is None or start_year >= self.min_year, \
+                print("Pick a different start year")
+            conditions.append('"Start Year" >= ?')
+            params.append(int(start_year))
+        if profiles:
+            conditions.append('"Profile Name" IN (' + ", ".join("?" * len(profiles)) + ")")
+            params += list(profiles)
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        # the rows a query scans are only counted while stages are recorded
+        record_rows_in(lambda: self._query(f"SELECT count(*) AS views FROM views {where}",
+                                           params)["views"].iloc[0].item())
+        return where, params
+
+    def clear_views(self):
+        """
+        Does nothing, as nothing is kept between queries, to match WatchHistory
+        """
+
+    @stage
+    def time_watched(self, time_unit="year", start_year=None, profiles=None):
+        """
+        Totals time watched by time unit
+
+        Input:
+            time_unit (str): time_unit to slice data on
+            start_year (int): start year for data analysis
+            profiles (list of str): profile name(s) to filter
+
+        Returns (pd.dataframe): minutes watched per time unit
+        """
+        return self._by_time_unit("sum", time_unit, start_year, profiles)
+
+    @stage
+    def average_time_watched(self, time_unit="year", start_year=None, profiles=None):
+        """
+        Averages time watched per session by time unit
+
+        Input:
+            time_unit (str): time_unit to slice data on
+            start_year (int): start year for data analysis
+            profiles (list of str): profile name(s) to filter
+
+        Returns (pd.dataframe): average minutes watched per time unit
+        """
+        return self._by_time_unit("mean", time_unit, start_year, profiles)
+
+    def _by_time_unit(self, how, time_unit, start_year, profiles):
+        assert time_unit in TIME_UNITS, print("Pick a different time unit")
+
+        col_to_use = COLUMNS_TIME_DICT[time_unit]
+        where, params = self._where(start_year, profiles)
+        barplot = self._query(f"""
+            SELECT "{col_to_use}", CAST(sum({DURATION}) AS BIGINT) AS total, count(*) AS views
+            FROM views {where} GROUP BY "{col_to_use}" ORDER BY "{col_to_use}" """, params)
+        # divided here as pandas divides, so the results match to the bit
+        minutes = barplot["total"] / barplot["views"] if how == "mean" else barplot["total"]
+        barplot = barplot[[col_to_use]].assign(**{"Duration (min)": minutes / MINUTE_SCALE})
+        return name_time_units(barplot, time_unit)
+
+    @stage
+    def max_binges(self, number_binges=10, start_year=None, profiles=None, offset=0):
+        """
+        Finds the longest binges
+
+        Input:
+            number_binges (int): top binges to find
+            start_year (int): start year for data analysis
+            profiles (list of str): profile name(s) to filter
+            offset (int): longest binges to skip, to page through them
+
+        Returns (pd.dataframe): title, length, date and label of top binges
+        """
+        where, params = self._where(start_year, profiles)
+        top = self._query(f"""
+            SELECT "Title", {BINGE} AS "Binge (min)", "Start Year", "Start Month", "Start Day"
+            FROM views {where} ORDER BY "Binge (min)" DESC, {LOAD_ORDER}
+            LIMIT ? OFFSET ?""", params + [number_binges, offset])
+        return label_binges(top)
+
+    @stage
+    def time_watched_by_show(self, number_shows=10, start_year=None, profiles=None,
+                             offset=0):
+        """
+        Finds the shows watched the longest
+
+        Input:
+            number_shows (int): top shows to find
+            start_year (int): start year for data analysis
+            profiles (list of str): profile name(s) to filter
+            offset (int): top shows to skip, to page through them
+
+        Returns (pd.dataframe): minutes watched of top shows
+        """
+        where, params = self._where(start_year, profiles)
+        barplot = self._query(f"""
+            SELECT "Title", CAST(sum({DURATION}) AS BIGINT) AS "Duration (min)"
+            FROM views {where} GROUP BY "Title" ORDER BY "Duration (min)" DESC, "Title"
+            LIMIT ? OFFSET ?""", params + [number_shows, offset])
+        return barplot.assign(**{"Duration (min)": barplot["Duration (min)"] / MINUTE_SCALE})
+
+    @stage
+    def data_by_time_frame(self, time_unit="year", start_year=None, dur_type="show",
+                           profiles=None, number_shows=1, ties=True):
+        """
+        Finds the top shows or binges in each time frame
+
+        Input:
+            time_unit (str): time_unit to slice data on
+            start_year (int): start year for data analysis
+            dur_type(str): what to find (show or binge)
+            profiles (list of str): profile name(s) to filter
+            number_shows (int): top shows or binges to find per time frame
+            ties (bool): keep everything tied with the last place kept
+
+        Returns (pd.dataframe): time frame, title, minutes and rank of the top
+            shows or binges, one row each
+        """
+        assert time_unit in TIME_UNITS, print("Pick a different time unit")
+
+        assert dur_type in ["show", "binge"], print("Needs to be show or binge")
+
+        time_col = COLUMNS_TIME_DICT[time_unit]
+        where, params = self._where(start_year, profiles)
+        if dur_type == "show":
+            duration_col = "Duration (min)"
+            data_to_use = self._query(f"""
+                SELECT "{time_col}", "Title", CAST(sum({DURATION}) AS BIGINT) AS "{duration_col}"
+                FROM views {where} GROUP BY "{time_col}", "Title"
+                ORDER BY "{time_col}", "Title" """, params)
+        else:
+            # only binges that could be ranked in the top of their time frame
+            # leave DuckDB, in the order pandas would see them
+            duration_col = "Binge (min)"
+            data_to_use = self._query(f"""
+                SELECT "{time_col}", "Title", {BINGE} AS "{duration_col}" FROM views {where}
+                QUALIFY rank() OVER (PARTITION BY "{time_col}" ORDER BY "Binge (min)" DESC) <= ?
+                ORDER BY {LOAD_ORDER}""", params + [number_shows])
+        return rank_top(data_to_use, time_col, duration_col, number_shows, ties)
@@ -0,0 +1,258 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from time_stages import stage
+
+# types of the cleaned columns; low cardinality text is kept as categories
+# and the start time parts as small integers
+CLEANED_DTYPES = {"Profile Name": "category", "Start Year": "int16",
+                  "Start Month": "int8", "Start Day": "int8",
+                  "Start Day of Week": "int8", "Start Hour": "int8",
+                  "Start Minute": "int8", "Duration (min)": "float64",
+                  "Binge (min)": "float64", "Session ID": "int64",
+                  "Session Episodes": "int32", "Device Type": "category",
+                  "Title": "category", "Season": "category",
+                  # rollup counts
+                  "Views": "int32", "Binges": "int32"}
+DATE_COLUMNS = ["Session Start", "Session End"]
+TIMEZONE = "US/Central" # timezone that times are kept in
+PARTITION_COLUMNS = ["Profile Name", "Start Year"]
+
+# compact form of cleaned data (see compact_cleaned): text is kept as codes
+# into string tables, minutes as whole hundredths of a minute and session
+# times as whole seconds since SESSION_EPOCH
+TEXT_COLUMNS = ["Profile Name", "Device Type", "Title", "Subtitle", "Season", "Episode"]
+MINUTE_SCALE = 100
+MINUTE_DTYPES = {"Duration (min)": "int32", "Binge (min)": "int32",
+                 "Duration Max (min)": "int32", "Binge Max (min)": "int32",
+                 # rollup sums can outgrow int32
+                 "Duration Sum (min)": "int64", "Binge Sum (min)": "int64"}
+COMPACT_DTYPES = {"Session ID": "int32", "Session Episodes": "int16"}
+SESSION_EPOCH = np.datetime64("2000-01-01T00:00:00", "s")
+FORMATS = [".csv", ".parquet", ".feather"]
+
+def get_format(path):
+    """
+    Finds the storage format of a cleaned data path from its extension
+
+    Input:
+        path (filepath): cleaned data path
+
+    Returns (str): one of FORMATS
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Cleaned data must be saved as one of {FORMATS}")
+    return extension
+
+def store_version(path):
+    """
+    Names the version of saved cleaned data after the size and modification
+    time of its files, so that anything kept from it can tell when it changes
+
+    Input:
+        path (filepath): cleaned csv, feather file or parquet directory
+
+    Returns (str): version of the data at path
+    """
+    paths = [path]
+    if os.path.isdir(path):
+        paths = [os.path.join(root, name) for root, _, names in os.walk(path)
+                 for name in names]
+    stats = [os.stat(p) for p in paths]
+    return f"{sum(s.st_size for s in stats)}-{max(s.st_mtime_ns for s in stats)}-{len(stats)}"
+
+def apply_schema(data):
+    """
+    Casts cleaned columns to their CLEANED_DTYPES types
+
+    Input:
+        data (pd.dataframe): cleaned data, or some of its columns
+
+    Returns (pd.dataframe): typed data
+    """
+    dtypes = {col: dtype for col, dtype in CLEANED_DTYPES.items()
+              if col in data.columns}
+    data = data.astype(dtypes)
+    for col in DATE_COLUMNS:
+        if col in data.columns and not isinstance(data[col].dtype, pd.DatetimeTZDtype):
+            data[col] = pd.to_datetime(data[col], utc=True).dt.tz_convert(TIMEZONE)
+    return data
+
+def is_compact(data):
+    """
+    Checks whether cleaned data is in the compact form made by compact_cleaned
+
+    Input:
+        data (pd.dataframe): cleaned data, or some of its columns
+
+    Returns (bool): whether its minutes are kept as whole hundredths
+    """
+    return any(pd.api.types.is_integer_dtype(data[col]) for col in MINUTE_DTYPES
+               if col in data.columns)
+
+def compact_cleaned(data, tables=None):
+    """
+    Packs cleaned data into far less memory: text columns become codes into
+    a table of their strings, start time parts small integers, minutes
+    whole hundredths of a minute (see MINUTE_SCALE) and session times whole
+    seconds since SESSION_EPOCH. Sums of minutes stay exact this way, and
+    expand_cleaned gives back the data as it was
+
+    Input:
+        data (pd.dataframe): cleaned data or a rollup of it, or some of
+            their columns
+        tables (dict): string table of each text column, extended with any
+            new strings, so that data compacted with the same tables shares
+            codes. Defaults to new tables
+
+    Returns (pd.dataframe): compact data
+    """
+    if is_compact(data):
+        return data
+    tables = {} if tables is None else tables
+    data = apply_schema(data)
+    columns = {}
+    for col in data.columns:
+        values = data[col]
+        if col in TEXT_COLUMNS:
+            strings = values.cat.categories if isinstance(values.dtype, pd.CategoricalDtype) \
+                else pd.Index(values.dropna().unique())
+            table = tables.get(col, pd.Index([], dtype=strings.dtype))
+            # new strings go on the end so existing codes don't change
+            tables[col] = table.append(strings.difference(table).sort_values())
+            columns[col] = pd.Categorical(values, categories=tables[col])
+        elif col in MINUTE_DTYPES:
+            columns[col] = np.rint(values.to_numpy() * MINUTE_SCALE).astype(MINUTE_DTYPES[col])
+        elif col in DATE_COLUMNS:
+            seconds = values.dt.tz_convert("UTC").dt.tz_localize(None).to_numpy("datetime64[s]")
+            columns[col] = (seconds - SESSION_EPOCH).astype("int32")
+        elif col in COMPACT_DTYPES:
+            columns[col] = values.to_numpy().astype(COMPACT_DTYPES[col])
+    return data.assign(**columns)
+
+def expand_cleaned(data):
+    """
+    Unpacks data made by compact_cleaned back into cleaned data typed as by
+    apply_schema, ready to save or compare with data read by read_cleaned
+
+    Input:
+        data (pd.dataframe): compact data, or some of its columns
+
+    Returns (pd.dataframe): cleaned data
+    """
+    if not is_compact(data):
+        return data
+    columns = {}
+    for col in data.columns:
+        values = data[col]
+        if col in TEXT_COLUMNS and col in CLEANED_DTYPES:
+            values = values.cat.remove_unused_categories()
+            columns[col] = values.cat.reorder_categories(values.cat.categories.sort_values())
+        elif col in TEXT_COLUMNS:
+            columns[col] = values.astype(values.cat.categories.dtype)
+        elif col in MINUTE_DTYPES:
+            columns[col] = values.to_numpy() / MINUTE_SCALE
+        elif col in DATE_COLUMNS:
+            seconds = SESSION_EPOCH + values.to_numpy().astype("timedelta64[s]")
+            columns[col] = pd.DatetimeIndex(seconds.astype("datetime64[us]"), tz="UTC") \
+                .tz_convert(TIMEZONE)
+    return apply_schema(data.assign(**columns))
+
+def _format_times(times):
+    # pandas formats timezone aware times one by one, so they are formatted
+    # as local times and their UTC offset added after, as pandas writes them.
+    # Fractions of a second are written per time, so those are left to pandas,
+    # as are columns with no times at all, which have no offsets to add
+    if times.isna().all() or (times.dt.microsecond != 0).any() or \
+            (times.dt.nanosecond != 0).any():
+        return times
+    local = times.dt.tz_localize(None)
+    offsets = (local - times.dt.tz_convert("UTC").dt.tz_localize(None)) // pd.Timedelta(minutes=1)
+    names = {offset: "{}{:02d}:{:02d}".format("-" if offset < 0 else "+", *divmod(abs(int(offset)), 60))
+             for offset in offsets.dropna().unique()}
+    return (local.astype(str) + offsets.map(names)).where(times.notna())
+
+@stage
+def write_cleaned(data, path, append=False, replace_partitions=False,
+                  partition_cols=PARTITION_COLUMNS):
+    """
+    Saves cleaned data as csv, feather, or parquet partitioned by profile
+    and start year
+
+    Input:
+        data (pd.dataframe): cleaned data, compact or not
+        path (filepath): where to save, its extension picks the format
+        append (bool): add to data already saved at path (csv and parquet)
+        replace_partitions (bool): overwrite only the profile and year
+            partitions found in data, keeping the rest (parquet)
+        partition_cols (list of str): columns to partition parquet by
+    """
+    file_format = get_format(path)
+    if file_format == ".feather" and append:
+        raise ValueError("Feather files can't be appended to")
+    data = expand_cleaned(data)
+    if file_format == ".csv":
+        data = data.assign(**{col: _format_times(data[col]) for col in DATE_COLUMNS
+                              if col in data.columns})
+        data.to_csv(path, index=False, mode="a" if append else "w",
+                    header=not append)
+        return
+
+    data = apply_schema(data)
+    if file_format == ".feather":
+        data.reset_index(drop=True).to_feather(path, compression="zstd")
+    else:
+        # a parquet dataset is a directory, so clear out any old one
+        if not append and not replace_partitions and os.path.isdir(path):
+            shutil.rmtree(path)
+        data.to_parquet(path, partition_cols=partition_cols, index=False,
+                        compression="zstd", existing_data_behavior=
+                        "delete_matching" if replace_partitions else "overwrite_or_ignore")
+
+@stage
+def read_cleaned(path, columns=None, start_year=None, profiles=None, compact=False,
+                 tables=None):
+    """
+    Loads cleaned data, reading only the columns, years and profiles asked for
+
+    Input:
+        path (filepath): cleaned csv, feather file or parquet directory
+        columns (list of str): columns to read, defaults to all of them
+        start_year (int): earliest year to read
+        profiles (list of str): profile name(s) to read
+        compact (bool): return the data packed by compact_cleaned
+        tables (dict): string tables to compact with, see compact_cleaned
+
+    Returns (pd.dataframe): typed cleaned data
+    """
+    file_format = get_format(path)
+    if columns is not None:
+        # keep the columns needed to filter on
+        columns = list(dict.fromkeys(columns + ["Start Year"] +
+                                     (["Profile Name"] if profiles else [])))
+
+    if file_format == ".parquet":
+        # only the matching year and profile partitions are read
+        filters = []
+        if start_year:
+            filters.append(("Start Year", ">=", start_year))
+        if profiles:
+            filters.append(("Profile Name", "in", list(profiles)))
+        # text compacts quicker when read straight into codes and strings
+        data = pd.read_parquet(path, columns=columns, filters=filters or None,
+                               read_dictionary=TEXT_COLUMNS if compact else None)
+        return compact_cleaned(data, tables) if compact else apply_schema(data)
+
+    if file_format == ".csv":
+        data = pd.read_csv(path, usecols=columns, dtype={
+            col: dtype for col, dtype in CLEANED_DTYPES.items()
+            if columns is None or col in columns})
+    else:
+        data = pd.read_feather(path, columns=columns)
+    if start_year:
+        data = data[ (data["Start Year"] >= start_year) ]
+    if profiles:
+        data = data[ (data["Profile Name"].isin(profiles)) ]
+    return compact_cleaned(data, tables) if compact else apply_schema(data)
@@ -0,0 +1,143 @@
+import functools
+import json
+import os
+import time
+import tracemalloc
+
+TRACE_FORMATS = ["json", "chrome"]
+
+# stages finished since start_recording, or None when not recording
+_records = None
+_running = []
+_memory = False
+_start = 0
+
+def start_recording(memory=False):
+    """
+    Starts recording the wall time and rows in and out of every stage run,
+    and optionally their peak memory
+
+    Input:
+        memory (bool): also record peak memory, which slows the stages down
+    """
+    global _records, _memory, _start
+    _records, _memory = [], memory
+    _running.clear()
+    if memory:
+        tracemalloc.start()
+    _start = time.perf_counter()
+
+def stop_recording():
+    """
+    Stops recording stages
+
+    Returns (list of dict): each stage run, in the order they finished
+    """
+    global _records
+    records, _records = _records or [], None
+    if _memory:
+        tracemalloc.stop()
+    return records
+
+def stage(func):
+    """
+    Records each call of func as a stage while recording is on; when it is
+    off the only cost is checking that it is off
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _records is None:
+            return func(*args, **kwargs)
+        return _record_stage(func, args, kwargs)
+    return wrapper
+
+def record_rows_in(rows):
+    """
+    Records the rows the running stage works on, for stages not passed
+    their data, e.g. methods filtering the data their object holds
+
+    Input:
+        rows (int or function): rows, or a function counting them, which is
+            only called while recording
+    """
+    if _records is not None and _running:
+        _running[-1]["rows in"] = rows() if callable(rows) else rows
+
+def _rows(value):
+    if isinstance(value, dict):
+        # a dict of columns
+        value = next(iter(value.values()), None)
+    if hasattr(value, "__len__") and not isinstance(value, (str, bytes)):
+        return len(value)
+    return None
+
+def _record_stage(func, args, kwargs):
+    # the data of a method comes after self, if it is passed in at all
+    data_arg = 1 if "." in func.__qualname__.split("<locals>.")[-1] else 0
+    record = {"stage": func.__qualname__, "depth": len(_running),
+              "rows in": _rows(args[data_arg]) if len(args) > data_arg else None}
+    # the peak memory counter is reset for each stage, so the stage running
+    # it keeps the highest peak seen before and by its inner stages
+    if _memory:
+        if _running:
+            _running[-1]["peak"] = max(_running[-1]["peak"], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    running = {"peak": 0}
+    _running.append(running)
+    start = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+        record["rows out"] = _rows(result)
+        return result
+    finally:
+        record["rows in"] = running.get("rows in", record["rows in"])
+        record["start (s)"] = start - _start
+        record["seconds"] = time.perf_counter() - start
+        _running.pop()
+        if _memory:
+            peak = max(running["peak"], tracemalloc.get_traced_memory()[1])
+            record["peak memory (MB)"] = peak / 2**20
+            if _running:
+                _running[-1]["peak"] = max(_running[-1]["peak"], peak)
+        if _records is not None:
+            _records.append(record)
+
+def write_trace(records, path, trace_format="json"):
+    """
+    Saves recorded stages as a json list, or as a Chrome trace to open in
+    chrome://tracing or Perfetto
+
+    Input:
+        records (list of dict): output of stop_recording
+        path (filepath): where to save them
+        trace_format (str): json or chrome
+    """
+    assert trace_format in TRACE_FORMATS, print(f"Pick one of {TRACE_FORMATS}")
+    if trace_format == "chrome":
+        events = [{"name": record["stage"], "ph": "X", "pid": os.getpid(), "tid": 0,
+                   "ts": record["start (s)"] * 1e6, "dur": record["seconds"] * 1e6,
+                   "args": {key: value for key, value in record.items()
+                            if key not in ["stage", "start (s)", "seconds", "depth"]}}
+                  for record in records]
+        records = {"traceEvents": events, "displayTimeUnit": "ms"}
+    with open(path, "w") as f:
+        json.dump(records, f, indent=1)
+
+def summarize(records):
+    """
+    Totals recorded stages by name, slowest first
+
+    Input:
+        records (list of dict): output of stop_recording
+
+    Returns (str): one line per stage with its calls, seconds and rows
+    """
+    totals = {}
+    for record in records:
+        total = totals.setdefault(record["stage"], {"calls": 0, "seconds": 0, "rows out": 0})
+        total["calls"] += 1
+        total["seconds"] += record["seconds"]
+        total["rows out"] += record.get("rows out") or 0
+    return "\n".join(f"{name:40} {total['calls']:4} calls {total['seconds']:8.3f}s "
+                     f"{total['rows out']:10} rows out"
+                     for name, total in sorted(totals.items(), key=lambda t: -t[1]["seconds"]))